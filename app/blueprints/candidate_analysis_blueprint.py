@@ -1,6 +1,18 @@
 from pydantic import BaseModel
+from typing import Optional
 
 
 
 class CandidateAnalysisRequestBody(BaseModel):
-    job_description: str
\ No newline at end of file
+    job_description: str
+
+
+class BatchCandidate(BaseModel):
+    salesforce_user_id: str
+    call_id: Optional[list[str]] = None
+
+
+class CandidateBatchAnalysisRequestBody(BaseModel):
+    job_description: str
+    candidates: list[BatchCandidate]
+    force_refresh: bool = False
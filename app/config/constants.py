@@ -9,6 +9,12 @@ oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/token")
 
 USERS_COLLECTION = "users"
 CALL_DETAILS_COLLECTION = "call_details"
+CONVERSATION_SUMMARIES_COLLECTION = "conversation_summaries"
+RESUME_TEXTS_COLLECTION = "resume_texts"
+ANALYSIS_JOBS_COLLECTION = "analysis_jobs"
+CONVERSATION_METRICS_COLLECTION = "conversation_metrics"
+GONG_SYNC_STATE_COLLECTION = "gong_sync_state"
+GONG_DAILY_QUOTA_COLLECTION = "gong_daily_quota"
 
 # keys
 USER_ID_FIELD = "user_id"
@@ -24,4 +30,117 @@ GONG_BASE_URL = os.getenv("GONG_BASE_URL")
 SALESFORCE_USERNAME = os.getenv("SALESFORCE_USERNAME")
 SALESFORCE_PASSWORD = os.getenv("SALESFORCE_PASSWORD")
 SALESFORCE_SECURITY_TOKEN = os.getenv("SALESFORCE_SECURITY_TOKEN")
-SALESFORCE_DOMAIN = os.getenv("SALESFORCE_DOMAIN")
\ No newline at end of file
+SALESFORCE_DOMAIN = os.getenv("SALESFORCE_DOMAIN")
+
+# Maximum number of call transcripts summarized concurrently by the OpenAI client
+SUMMARY_CONCURRENCY = int(os.getenv("SUMMARY_CONCURRENCY", "5"))
+
+# Whole-analysis result cache
+ANALYSIS_RESULT_CACHE_TTL_SECONDS = int(os.getenv("ANALYSIS_RESULT_CACHE_TTL_SECONDS", "3600"))
+ANALYSIS_RESULT_CACHE_MAX_ENTRIES = int(os.getenv("ANALYSIS_RESULT_CACHE_MAX_ENTRIES", "512"))
+
+# Seconds without a stage event after which the analysis stream sends a keep-alive comment
+SSE_HEARTBEAT_SECONDS = float(os.getenv("SSE_HEARTBEAT_SECONDS", "15"))
+
+# Batch analysis, the concurrency limit is shared by every batch running in the process
+BATCH_ANALYSIS_CONCURRENCY = int(os.getenv("BATCH_ANALYSIS_CONCURRENCY", "5"))
+BATCH_ANALYSIS_MAX_CANDIDATES = int(os.getenv("BATCH_ANALYSIS_MAX_CANDIDATES", "100"))
+
+# Background analysis jobs
+ANALYSIS_JOB_WORKERS = int(os.getenv("ANALYSIS_JOB_WORKERS", "2"))
+ANALYSIS_JOB_LEASE_SECONDS = int(os.getenv("ANALYSIS_JOB_LEASE_SECONDS", "300"))
+ANALYSIS_JOB_POLL_SECONDS = float(os.getenv("ANALYSIS_JOB_POLL_SECONDS", "2"))
+ANALYSIS_JOB_MAX_ATTEMPTS = int(os.getenv("ANALYSIS_JOB_MAX_ATTEMPTS", "3"))
+
+# Token budgets, transcripts above TRANSCRIPT_CHUNK_TOKENS are summarized in chunks and reduced.
+# MAX_PROMPT_TOKENS bounds the user message of the evaluation, the system prompt is not counted
+TRANSCRIPT_CHUNK_TOKENS = int(os.getenv("TRANSCRIPT_CHUNK_TOKENS", "12000"))
+MAX_PROMPT_TOKENS = int(os.getenv("MAX_PROMPT_TOKENS", "30000"))
+
+# Comma separated models tried in order for each pipeline stage, later ones are fallback tiers
+def get_model_route(name, default):
+    """Read a model route, ignoring blanks around and between the commas. A route naming no model gets default."""
+    models = [model.strip() for model in os.getenv(name, default).split(",") if model.strip()]
+    return models or default.split(",")
+
+
+MODEL_ROUTE_SUMMARIZE = get_model_route("MODEL_ROUTE_SUMMARIZE", "gpt-4o-mini,gpt-4o")
+MODEL_ROUTE_EVALUATE = get_model_route("MODEL_ROUTE_EVALUATE", "gpt-4o,gpt-4o-mini")
+MODEL_ROUTE_TEST = get_model_route("MODEL_ROUTE_TEST", "gpt-4o-mini")
+
+# LLM gateway, limits are per process so divide the organization limits by the number of workers
+LLM_REQUESTS_PER_MINUTE = int(os.getenv("LLM_REQUESTS_PER_MINUTE", "500"))
+LLM_TOKENS_PER_MINUTE = int(os.getenv("LLM_TOKENS_PER_MINUTE", "300000"))
+LLM_ESTIMATED_COMPLETION_TOKENS = int(os.getenv("LLM_ESTIMATED_COMPLETION_TOKENS", "1000"))
+LLM_REQUEST_TIMEOUT_SECONDS = float(os.getenv("LLM_REQUEST_TIMEOUT_SECONDS", "120"))
+LLM_GATEWAY_MAX_QUEUE_SECONDS = float(os.getenv("LLM_GATEWAY_MAX_QUEUE_SECONDS", "60"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))
+LLM_BASE_BACKOFF_SECONDS = float(os.getenv("LLM_BASE_BACKOFF_SECONDS", "1"))
+LLM_MAX_BACKOFF_SECONDS = float(os.getenv("LLM_MAX_BACKOFF_SECONDS", "30"))
+
+# Prompt caching: prefill time one cached prompt token saves, used to estimate the latency caching saved
+PROMPT_CACHE_SECONDS_SAVED_PER_1K_TOKENS = float(os.getenv("PROMPT_CACHE_SECONDS_SAVED_PER_1K_TOKENS", "0.04"))
+
+# Packed summarization: transcripts up to PACKED_SUMMARY_MAX_CALL_TOKENS are summarized together, up to the pack budget
+PACKED_SUMMARY_MAX_CALL_TOKENS = int(os.getenv("PACKED_SUMMARY_MAX_CALL_TOKENS", "2000"))
+PACKED_SUMMARY_MAX_TOKENS = int(os.getenv("PACKED_SUMMARY_MAX_TOKENS", "8000"))
+PACKED_SUMMARY_MAX_CALLS = int(os.getenv("PACKED_SUMMARY_MAX_CALLS", "6"))
+
+# Hedged requests: a duplicate call is sent once a call runs past LLM_HEDGE_PERCENTILE of recent latencies
+LLM_HEDGING_ENABLED = os.getenv("LLM_HEDGING_ENABLED", "false").lower() == "true"
+LLM_HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", "95"))
+LLM_HEDGE_LATENCY_WINDOW = int(os.getenv("LLM_HEDGE_LATENCY_WINDOW", "200"))
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))
+LLM_HEDGE_MAX_RATE = float(os.getenv("LLM_HEDGE_MAX_RATE", "0.1"))
+
+# Transcript compaction before summarization
+TRANSCRIPT_COMPACTION_ENABLED = os.getenv("TRANSCRIPT_COMPACTION_ENABLED", "true").lower() == "true"
+TRANSCRIPT_DEDUP_WINDOW_SENTENCES = int(os.getenv("TRANSCRIPT_DEDUP_WINDOW_SENTENCES", "50"))
+# Shorter sentences, like "No." or "I did.", are never dropped as repeats
+TRANSCRIPT_DEDUP_MIN_WORDS = int(os.getenv("TRANSCRIPT_DEDUP_MIN_WORDS", "4"))
+
+# Token bounds of the normalized resume and note in the evaluation prompt
+RESUME_PROMPT_MAX_TOKENS = int(os.getenv("RESUME_PROMPT_MAX_TOKENS", "4000"))
+NOTES_PROMPT_MAX_TOKENS = int(os.getenv("NOTES_PROMPT_MAX_TOKENS", "1500"))
+
+# Analysis deadline, split across the pipeline stages; the evaluation gets what the earlier stages leave
+ANALYSIS_DEADLINE_SECONDS = float(os.getenv("ANALYSIS_DEADLINE_SECONDS", "180"))
+RESUME_STAGE_TIMEOUT_SECONDS = float(os.getenv("RESUME_STAGE_TIMEOUT_SECONDS", "30"))
+NOTES_STAGE_TIMEOUT_SECONDS = float(os.getenv("NOTES_STAGE_TIMEOUT_SECONDS", "15"))
+TRANSCRIPT_FETCH_TIMEOUT_SECONDS = float(os.getenv("TRANSCRIPT_FETCH_TIMEOUT_SECONDS", "30"))
+CALL_SUMMARY_TIMEOUT_SECONDS = float(os.getenv("CALL_SUMMARY_TIMEOUT_SECONDS", "60"))
+EVALUATION_RESERVED_SECONDS = float(os.getenv("EVALUATION_RESERVED_SECONDS", "60"))
+
+# Timeouts of the HTTP requests to Gong and Salesforce
+UPSTREAM_CONNECT_TIMEOUT_SECONDS = float(os.getenv("UPSTREAM_CONNECT_TIMEOUT_SECONDS", "5"))
+UPSTREAM_READ_TIMEOUT_SECONDS = float(os.getenv("UPSTREAM_READ_TIMEOUT_SECONDS", "30"))
+UPSTREAM_REQUEST_TIMEOUT = (UPSTREAM_CONNECT_TIMEOUT_SECONDS, UPSTREAM_READ_TIMEOUT_SECONDS)
+
+# Incremental Gong call sync: each run starts GONG_SYNC_OVERLAP_HOURS before the previous one ended,
+# to pick up calls Gong processed late. The first run starts at GONG_SYNC_START_DATE, or at the oldest call when unset
+GONG_SYNC_START_DATE = os.getenv("GONG_SYNC_START_DATE")
+GONG_SYNC_OVERLAP_HOURS = float(os.getenv("GONG_SYNC_OVERLAP_HOURS", "24"))
+
+# Connection pool of the shared Gong HTTP client
+GONG_MAX_CONNECTIONS = int(os.getenv("GONG_MAX_CONNECTIONS", "20"))
+GONG_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("GONG_MAX_KEEPALIVE_CONNECTIONS", "10"))
+
+# Gong request scheduler, the rate limit is per process so divide it by the number of workers;
+# the daily quota is counted in Mongo, across workers
+GONG_REQUESTS_PER_SECOND = float(os.getenv("GONG_REQUESTS_PER_SECOND", "3"))
+GONG_DAILY_REQUEST_QUOTA = int(os.getenv("GONG_DAILY_REQUEST_QUOTA", "10000"))
+# Share of the daily quota bulk syncs leave to interactive requests
+GONG_INTERACTIVE_DAILY_RESERVE = int(os.getenv("GONG_INTERACTIVE_DAILY_RESERVE", "1000"))
+GONG_MAX_RETRIES = int(os.getenv("GONG_MAX_RETRIES", "3"))
+GONG_DEFAULT_RETRY_AFTER_SECONDS = float(os.getenv("GONG_DEFAULT_RETRY_AFTER_SECONDS", "1"))
+
+# Pages of Gong calls fetched ahead of the database writes during a sync
+GONG_SYNC_QUEUE_PAGES = int(os.getenv("GONG_SYNC_QUEUE_PAGES", "2"))
+
+# A Gong sync holds a lease on its checkpoint, renewed while it runs, so one run at a time owns it across workers
+GONG_SYNC_LEASE_SECONDS = int(os.getenv("GONG_SYNC_LEASE_SECONDS", "300"))
+
+# Historical Gong backfill: the date range is split into windows synced concurrently, each with its own checkpoint
+GONG_BACKFILL_WINDOW_DAYS = float(os.getenv("GONG_BACKFILL_WINDOW_DAYS", "30"))
+GONG_BACKFILL_CONCURRENCY = int(os.getenv("GONG_BACKFILL_CONCURRENCY", "4"))
+GONG_BACKFILL_MAX_WINDOWS = int(os.getenv("GONG_BACKFILL_MAX_WINDOWS", "500"))
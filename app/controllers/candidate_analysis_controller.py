@@ -1,11 +1,14 @@
 from fastapi import APIRouter, Depends
 from logging_module import logger
 from utils.dependencies import get_current_user_id
-from services import candidate_analysis_service
-from fastapi.responses import JSONResponse
+from services import analysis_job_service, candidate_analysis_service
+from fastapi.responses import JSONResponse, StreamingResponse
 from typing import Optional
 from utils import helper_functions
-from blueprints.candidate_analysis_blueprint import CandidateAnalysisRequestBody
+from blueprints.candidate_analysis_blueprint import (
+    CandidateAnalysisRequestBody,
+    CandidateBatchAnalysisRequestBody,
+)
 
 router = APIRouter()
 
@@ -21,16 +24,28 @@ async def test_gpt(user_id: str = Depends(get_current_user_id)):
     )
 
 
+@router.get("/llm-metrics")
+async def get_llm_metrics(user_id: str = Depends(get_current_user_id)):
+    """Get latency and token counts of the LLM calls per pipeline stage and model tier."""
+    logger.info("Get LLM metrics entry point")
+    response = await candidate_analysis_service.get_llm_metrics()
+    logger.info("Get LLM metrics exit point")
+    return JSONResponse(
+        content={"response": response}, status_code=response["status_code"]
+    )
+
+
 @router.post("/analyze-candidate")
 async def analyze_candidate(
     request: CandidateAnalysisRequestBody,
     salesforce_user_id: str,
     call_id: Optional[list[str]] = None,
+    force_refresh: bool = False,
 ):
     """Analyze the candidate based on job description and transcript."""
     logger.info("Analyze candidate entry point")
     response = await candidate_analysis_service.analyze_candidate(
-        request.job_description, call_id, salesforce_user_id
+        request.job_description, call_id, salesforce_user_id, force_refresh
     )
     logger.info("Analyze candidate exit point")
     return JSONResponse(
@@ -38,6 +53,97 @@ async def analyze_candidate(
     )
 
 
+@router.post("/analyze-candidate/estimate")
+async def estimate_analysis(
+    request: CandidateAnalysisRequestBody,
+    salesforce_user_id: str,
+    call_id: Optional[list[str]] = None,
+):
+    """Estimate the tokens, LLM calls and latency of analyzing the candidate, without calling the model."""
+    logger.info("Estimate analysis entry point")
+    response = await candidate_analysis_service.estimate_analysis(
+        request.job_description, call_id, salesforce_user_id
+    )
+    logger.info("Estimate analysis exit point")
+    return JSONResponse(
+        content={"response": response}, status_code=response["status_code"]
+    )
+
+
+@router.post("/analyze-candidate/stream")
+async def analyze_candidate_stream(
+    request: CandidateAnalysisRequestBody,
+    salesforce_user_id: str,
+    call_id: Optional[list[str]] = None,
+    force_refresh: bool = False,
+):
+    """Analyze the candidate, streaming stage progress and the model output as server-sent events."""
+    logger.info("Analyze candidate stream entry point")
+    return StreamingResponse(
+        candidate_analysis_service.stream_analyze_candidate(
+            request.job_description, call_id, salesforce_user_id, force_refresh
+        ),
+        media_type="text/event-stream",
+        # Disable proxy buffering so events reach the client as they are produced
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.post("/analyze-candidates-batch")
+async def analyze_candidates_batch(request: CandidateBatchAnalysisRequestBody):
+    """Analyze many candidates against the same job description."""
+    logger.info("Analyze candidates batch entry point")
+    response = await candidate_analysis_service.analyze_candidates_batch(
+        request.job_description, request.candidates, request.force_refresh
+    )
+    logger.info("Analyze candidates batch exit point")
+    return JSONResponse(
+        content={"response": response}, status_code=response["status_code"]
+    )
+
+
+@router.post("/analyze-candidates-batch/estimate")
+async def estimate_candidates_batch(request: CandidateBatchAnalysisRequestBody):
+    """Estimate the tokens, LLM calls and latency of a batch analysis, without calling the model."""
+    logger.info("Estimate candidates batch entry point")
+    response = await candidate_analysis_service.estimate_candidates_batch(
+        request.job_description, request.candidates
+    )
+    logger.info("Estimate candidates batch exit point")
+    return JSONResponse(
+        content={"response": response}, status_code=response["status_code"]
+    )
+
+
+@router.post("/analysis-jobs")
+async def submit_analysis_job(
+    request: CandidateAnalysisRequestBody,
+    salesforce_user_id: str,
+    call_id: Optional[list[str]] = None,
+    force_refresh: bool = False,
+):
+    """Queue a candidate analysis and return its job id immediately."""
+    logger.info("Submit analysis job entry point")
+    response = await analysis_job_service.submit_analysis_job(
+        request.job_description, call_id, salesforce_user_id, force_refresh
+    )
+    logger.info("Submit analysis job exit point")
+    return JSONResponse(
+        content={"response": response}, status_code=response["status_code"]
+    )
+
+
+@router.get("/analysis-jobs/{job_id}")
+async def get_analysis_job(job_id: str):
+    """Get the status, stage progress and result of a queued candidate analysis."""
+    logger.info("Get analysis job entry point")
+    response = await analysis_job_service.get_analysis_job(job_id)
+    logger.info("Get analysis job exit point")
+    return JSONResponse(
+        content={"response": response}, status_code=response["status_code"]
+    )
+
+
 @router.get("/get-content-of-pdf-from-salesforce-user")
 async def get_content_of_pdf_from_salesforce_user(salesforce_user_id: str, user_id: str = Depends(get_current_user_id)):
     """Get the content of the first PDF file from a Salesforce user."""
@@ -51,6 +51,37 @@ async def get_gong_extensive_call_data(
     logger.info("Get Gong Extensive Call Data exit point")
     return JSONResponse(content=response, status_code=response["status_code"])
 
+@router.post("/gong-backfill")
+async def gong_backfill(
+    from_date: str = Query(..., example="2022-01-01T00:00:00+00:00", description="Start of the range to backfill"),
+    to_date: Optional[str] = Query(None, example="2024-01-01T00:00:00+00:00", description="End of the range, now when omitted"),
+    window_days: Optional[float] = Query(None, gt=0, description="Days per window, GONG_BACKFILL_WINDOW_DAYS when omitted"),
+    user_id: str = Depends(get_current_user_id),
+):
+    """Load the Gong calls of a date range, split into windows fetched concurrently."""
+    logger.info("Gong Backfill entry point")
+    response = await gong_service.gong_backfill(from_date, to_date, window_days)
+    logger.info("Gong Backfill exit point")
+    return JSONResponse(content=response, status_code=response["status_code"])
+
+
+@router.post("/retry-gong-backfill-window")
+async def retry_gong_backfill_window(sync_id: str, user_id: str = Depends(get_current_user_id)):
+    """Run a single failed or interrupted backfill window again, from its checkpoint."""
+    logger.info("Retry Gong Backfill Window entry point")
+    response = await gong_service.retry_gong_backfill_window(sync_id)
+    logger.info("Retry Gong Backfill Window exit point")
+    return JSONResponse(content=response, status_code=response["status_code"])
+
+
+@router.get("/get-gong-backfill-windows")
+async def get_gong_backfill_windows(user_id: str = Depends(get_current_user_id)):
+    """Get the checkpoint and status of every backfill window."""
+    logger.info("Get Gong Backfill Windows entry point")
+    response = await gong_service.get_gong_backfill_windows()
+    logger.info("Get Gong Backfill Windows exit point")
+    return JSONResponse(content=response, status_code=response["status_code"])
+
 @router.get("/get-matching-calls")
 async def get_matching_calls(
     search_query: str = Query(..., example="Enablematch", description="Search query"),
@@ -59,4 +90,22 @@ async def get_matching_calls(
     logger.info("Get Matching Calls title entry point")
     response = await gong_service.get_matching_records_with_title(search_query)
     logger.info("Get Matching Calls title exit point")
-    return JSONResponse(content=response, status_code=response["status_code"])
\ No newline at end of file
+    return JSONResponse(content=response, status_code=response["status_code"])
+
+
+@router.get("/get-conversation-metrics")
+async def get_conversation_metrics(call_id: str, user_id: str = Depends(get_current_user_id)):
+    """Get the talk ratio, monologue, interruption, question and response latency metrics of a call."""
+    logger.info("Get Conversation Metrics entry point")
+    response = await gong_service.get_conversation_metrics(call_id)
+    logger.info("Get Conversation Metrics exit point")
+    return JSONResponse(content=response, status_code=response["status_code"])
+
+
+@router.get("/get-gong-request-metrics")
+async def get_gong_request_metrics(user_id: str = Depends(get_current_user_id)):
+    """Get the request, rate limit and daily quota counters of the Gong scheduler."""
+    logger.info("Get Gong Request Metrics entry point")
+    response = await gong_service.get_gong_request_metrics()
+    logger.info("Get Gong Request Metrics exit point")
+    return JSONResponse(content=response, status_code=response["status_code"])
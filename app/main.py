@@ -8,15 +8,27 @@ from routers import (
     gong_router,
     salesforce_router
 )
+from services import analysis_job_service, cache_service, gong_service
+from utils.thirdparty import gong_api_service
 
 
 
 
 
 async def startup_lifespan():
-    pass
+    gong_api_service.start_gong_client()
+    await cache_service.ensure_cache_indexes()
+    await analysis_job_service.ensure_analysis_job_indexes()
+    await gong_service.ensure_gong_sync_indexes()
+    await gong_service.ensure_conversation_metrics_indexes()
+    analysis_job_service.start_analysis_job_workers()
 
-project = FastAPI(on_startup=[startup_lifespan])
+
+async def shutdown_lifespan():
+    await analysis_job_service.stop_analysis_job_workers()
+    await gong_api_service.close_gong_client()
+
+project = FastAPI(on_startup=[startup_lifespan], on_shutdown=[shutdown_lifespan])
 
 # Check if static directory is present or not
 static_dir = "static"
@@ -0,0 +1,82 @@
+"""Compare the transcript formatter with the previous one-line-per-sentence implementation.
+
+Run from the app directory:
+
+    python -m scripts.benchmark_parse_transcript --sections 20000
+"""
+from utils.token_utils import count_tokens
+from utils.transcript_utils import get_speaker_labels, parse_transcript
+from functools import partial
+import argparse
+import random
+import time
+
+
+def legacy_parse_transcript(transcript_json):
+    """The previous formatter, kept here as the baseline."""
+    conversation_transcript = ""
+    for section in transcript_json.get("transcript", []):
+        speaker_id = section.get("speakerId", "Unknown Speaker")
+        for sentence in section.get("sentences", []):
+            conversation_transcript += f"{speaker_id}: {sentence.get('text', '')}\n"
+    return {"transcript": conversation_transcript.strip(), "status_code": 200}
+
+
+def build_transcript(sections, speakers, seed):
+    """Build a synthetic Gong transcript where speakers often keep the floor across topic sections."""
+    rng = random.Random(seed)
+    speaker_ids = [str(rng.randrange(10**17, 10**18)) for _ in range(speakers)]
+    speaker_id = speaker_ids[0]
+    transcript = []
+    for index in range(sections):
+        if rng.random() < 0.6:
+            speaker_id = rng.choice(speaker_ids)
+        transcript.append(
+            {
+                "speakerId": speaker_id,
+                "topic": None,
+                "sentences": [
+                    {"start": index * 10000, "end": index * 10000 + 4000, "text": f"Sentence {index}.{n} about the enablement program and its metrics."}
+                    for n in range(rng.randint(1, 5))
+                ],
+            }
+        )
+    parties = [
+        {"speakerId": speaker_id, "name": f"Participant {number}", "title": "Hiring Manager" if number == 1 else None, "affiliation": "Internal"}
+        for number, speaker_id in enumerate(speaker_ids, start=1)
+    ]
+    return {"callId": "benchmark", "transcript": transcript}, parties
+
+
+def measure(formatter, repeat):
+    best_seconds = None
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        result = formatter()
+        elapsed_seconds = time.perf_counter() - start_time
+        best_seconds = elapsed_seconds if best_seconds is None else min(best_seconds, elapsed_seconds)
+    return best_seconds, result["transcript"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sections", type=int, nargs="+", default=[1000, 5000, 20000])
+    parser.add_argument("--speakers", type=int, default=3)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    print(f"{'sections':>9} {'formatter':>10} {'seconds':>9} {'lines':>8} {'tokens':>9}")
+    for sections in args.sections:
+        transcript_json, parties = build_transcript(sections, args.speakers, args.seed)
+        speaker_labels = get_speaker_labels(parties)
+        for name, formatter in (
+            ("legacy", partial(legacy_parse_transcript, transcript_json)),
+            ("current", partial(parse_transcript, transcript_json, speaker_labels)),
+        ):
+            seconds, output = measure(formatter, args.repeat)
+            print(f"{sections:>9} {name:>10} {seconds:>9.4f} {output.count(chr(10)) + 1:>8} {count_tokens(output):>9}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,209 @@
+from config.db_connection import db
+from config import constants
+from logging_module import logger
+from services import candidate_analysis_service
+from utils import helper_functions, llm_gateway
+from datetime import datetime, timedelta, timezone
+from pymongo import ReturnDocument
+from bson import ObjectId
+import asyncio
+import os
+import socket
+
+QUEUED = "queued"
+RUNNING = "running"
+COMPLETED = "completed"
+FAILED = "failed"
+
+worker_tasks = []
+
+
+def utc_now():
+    return datetime.now(timezone.utc)
+
+
+def serialize_job(job):
+    job = helper_functions.convert_object_datetime_keys_to_str(job)
+    job["job_id"] = str(job.pop(constants.MONGO_INDEX_FIELD))
+    job["stages"] = [helper_functions.convert_object_datetime_keys_to_str(stage) for stage in job.get("stages", [])]
+    return job
+
+
+async def ensure_analysis_job_indexes():
+    """Create the indexes workers claim jobs by."""
+    try:
+        jobs_collection = db[constants.ANALYSIS_JOBS_COLLECTION]
+        await jobs_collection.create_index([("status", 1), ("created_at", 1)])
+        await jobs_collection.create_index([("status", 1), ("lease_expires_at", 1)])
+    except Exception as e:
+        logger.error(f"Error while creating analysis job indexes: {e}")
+
+
+async def submit_analysis_job(job_description, call_id, salesforce_user_id, force_refresh=False):
+    """Queue a candidate analysis and return its job id without waiting for it."""
+    try:
+        jobs_collection = db[constants.ANALYSIS_JOBS_COLLECTION]
+        now = utc_now()
+        inserted_job = await jobs_collection.insert_one(
+            {
+                "status": QUEUED,
+                "job_description": job_description,
+                "call_id": call_id,
+                "salesforce_user_id": salesforce_user_id,
+                "force_refresh": force_refresh,
+                "attempts": 0,
+                "stages": [],
+                "created_at": now,
+                constants.UPDATED_AT_FIELD: now,
+            }
+        )
+        return {"job_id": str(inserted_job.inserted_id), "status": QUEUED, "status_code": 202}
+    except Exception as e:
+        logger.error(f"Error while submitting analysis job: {e}")
+        return {
+            "response": f"An error occurred while submitting the analysis job.{e}",
+            "status_code": 500,
+        }
+
+
+async def get_analysis_job(job_id):
+    """Get the state, stage progress and result of an analysis job."""
+    try:
+        if not ObjectId.is_valid(job_id):
+            return {"response": "Analysis job not found.", "status_code": 404}
+        jobs_collection = db[constants.ANALYSIS_JOBS_COLLECTION]
+        job = await jobs_collection.find_one(
+            {constants.MONGO_INDEX_FIELD: ObjectId(job_id)},
+            {"job_description": 0, "worker_id": 0, "lease_expires_at": 0},
+        )
+        if not job:
+            return {"response": "Analysis job not found.", "status_code": 404}
+        return {"response": serialize_job(job), "status_code": 200}
+    except Exception as e:
+        logger.error(f"Error while fetching analysis job {job_id}: {e}")
+        return {
+            "response": f"An error occurred while fetching the analysis job.{e}",
+            "status_code": 500,
+        }
+
+
+async def claim_next_analysis_job(worker_id):
+    """Atomically take the oldest queued job, or a running job whose worker stopped renewing its lease."""
+    jobs_collection = db[constants.ANALYSIS_JOBS_COLLECTION]
+    now = utc_now()
+    return await jobs_collection.find_one_and_update(
+        {
+            "$or": [
+                {"status": QUEUED},
+                {"status": RUNNING, "lease_expires_at": {"$lt": now}},
+            ]
+        },
+        {
+            "$set": {
+                "status": RUNNING,
+                "worker_id": worker_id,
+                "lease_expires_at": now + timedelta(seconds=constants.ANALYSIS_JOB_LEASE_SECONDS),
+                "started_at": now,
+                constants.UPDATED_AT_FIELD: now,
+            },
+            "$inc": {"attempts": 1},
+        },
+        sort=[("created_at", 1)],
+        return_document=ReturnDocument.AFTER,
+    )
+
+
+async def update_claimed_job(job_id, worker_id, update):
+    """Update a job only while this worker still holds its lease."""
+    jobs_collection = db[constants.ANALYSIS_JOBS_COLLECTION]
+    update.setdefault("$set", {})[constants.UPDATED_AT_FIELD] = utc_now()
+    return await jobs_collection.update_one(
+        {constants.MONGO_INDEX_FIELD: job_id, "worker_id": worker_id, "status": RUNNING},
+        update,
+    )
+
+
+async def renew_job_lease(job_id, worker_id):
+    """Keep extending the lease of a job for as long as it runs."""
+    while True:
+        await asyncio.sleep(constants.ANALYSIS_JOB_LEASE_SECONDS / 3)
+        await update_claimed_job(
+            job_id,
+            worker_id,
+            {"$set": {"lease_expires_at": utc_now() + timedelta(seconds=constants.ANALYSIS_JOB_LEASE_SECONDS)}},
+        )
+
+
+async def run_analysis_job(job, worker_id):
+    """Run a claimed job and persist its stage progress and outcome."""
+    job_id = job[constants.MONGO_INDEX_FIELD]
+    if job["attempts"] > constants.ANALYSIS_JOB_MAX_ATTEMPTS:
+        logger.error(f"Analysis job {job_id} exceeded {constants.ANALYSIS_JOB_MAX_ATTEMPTS} attempts")
+        await update_claimed_job(
+            job_id,
+            worker_id,
+            {"$set": {"status": FAILED, "error": "Maximum number of attempts exceeded.", "completed_at": utc_now()}},
+        )
+        return
+
+    async def on_event(event, data):
+        await update_claimed_job(
+            job_id, worker_id, {"$push": {"stages": {"event": event, "data": data, "at": utc_now()}}}
+        )
+
+    logger.info(f"Worker {worker_id} running analysis job {job_id} (attempt {job['attempts']})")
+    lease_renewal = asyncio.create_task(renew_job_lease(job_id, worker_id))
+    try:
+        # A resumed job starts over, the summary and resume caches make the repeated stages cheap
+        await update_claimed_job(job_id, worker_id, {"$set": {"stages": []}})
+        result = await candidate_analysis_service.analyze_candidate(
+            job["job_description"],
+            job["call_id"],
+            job["salesforce_user_id"],
+            job.get("force_refresh", False),
+            on_event=on_event,
+        )
+        status = COMPLETED if result.get("status_code") == 200 else FAILED
+        await update_claimed_job(
+            job_id, worker_id, {"$set": {"status": status, "result": result, "completed_at": utc_now()}}
+        )
+        logger.info(f"Analysis job {job_id} {status}")
+    except asyncio.CancelledError:
+        # Shutting down: hand the job back so the next worker picks it up without waiting for the lease
+        await update_claimed_job(job_id, worker_id, {"$set": {"status": QUEUED}, "$unset": {"lease_expires_at": ""}})
+        raise
+    finally:
+        lease_renewal.cancel()
+
+
+async def run_analysis_job_worker(worker_id):
+    """Claim and run analysis jobs until cancelled."""
+    # Queued jobs yield to interactive requests at the LLM gateway
+    llm_gateway.llm_priority.set(llm_gateway.PRIORITY_BACKGROUND)
+    while True:
+        try:
+            job = await claim_next_analysis_job(worker_id)
+            if not job:
+                await asyncio.sleep(constants.ANALYSIS_JOB_POLL_SECONDS)
+                continue
+            await run_analysis_job(job, worker_id)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Error in analysis job worker {worker_id}: {e}")
+            await asyncio.sleep(constants.ANALYSIS_JOB_POLL_SECONDS)
+
+
+def start_analysis_job_workers():
+    """Start the in-process pool of analysis job workers."""
+    for index in range(constants.ANALYSIS_JOB_WORKERS):
+        worker_id = f"{socket.gethostname()}:{os.getpid()}:{index}"
+        worker_tasks.append(asyncio.create_task(run_analysis_job_worker(worker_id)))
+
+
+async def stop_analysis_job_workers():
+    """Cancel the workers, running jobs are handed back to the queue."""
+    for worker_task in worker_tasks:
+        worker_task.cancel()
+    await asyncio.gather(*worker_tasks, return_exceptions=True)
+    worker_tasks.clear()
@@ -0,0 +1,135 @@
+from config.db_connection import db
+from config import constants
+from logging_module import logger
+from utils.ttl_cache import TTLCache
+from utils.document_utils import DOCUMENT_NORMALIZER_VERSION
+from datetime import datetime, timezone
+import hashlib
+
+
+# Whole-analysis results live in process memory, they are cheap to recompute from the persistent caches
+analysis_result_cache = TTLCache(
+    constants.ANALYSIS_RESULT_CACHE_MAX_ENTRIES, constants.ANALYSIS_RESULT_CACHE_TTL_SECONDS
+)
+
+
+def hash_content(*parts):
+    """Return a stable sha256 hex digest of the given text parts."""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update((part or "").encode("utf-8"))
+        # Separator so that ("ab", "c") and ("a", "bc") hash differently
+        digest.update(b"\x1f")
+    return digest.hexdigest()
+
+
+async def ensure_cache_indexes():
+    """Create the indexes the cache collections are looked up by."""
+    try:
+        summaries_collection = db[constants.CONVERSATION_SUMMARIES_COLLECTION]
+        await summaries_collection.create_index(
+            [("call_id", 1), ("transcript_hash", 1), ("summarizer_version", 1)],
+            unique=True,
+        )
+        resume_texts_collection = db[constants.RESUME_TEXTS_COLLECTION]
+        await resume_texts_collection.create_index(
+            [("content_document_id", 1), ("content_version_id", 1)],
+            unique=True,
+        )
+    except Exception as e:
+        logger.error(f"Error while creating cache indexes: {e}")
+
+
+def get_conversation_summary_key(call_id, transcript, summarizer_version):
+    return {
+        "call_id": call_id,
+        "transcript_hash": hash_content(transcript),
+        "summarizer_version": summarizer_version,
+    }
+
+
+async def get_cached_conversation_summary(call_id, transcript, summarizer_version):
+    """Get the stored summary of a Gong call transcript, None when it was never summarized."""
+    try:
+        summaries_collection = db[constants.CONVERSATION_SUMMARIES_COLLECTION]
+        record = await summaries_collection.find_one(
+            get_conversation_summary_key(call_id, transcript, summarizer_version)
+        )
+        return record["summary"] if record else None
+    except Exception as e:
+        logger.error(f"Error while reading conversation summary of call {call_id}: {e}")
+        return None
+
+
+async def save_conversation_summary(call_id, transcript, summarizer_version, summary):
+    """Store the summary of a Gong call transcript."""
+    try:
+        summaries_collection = db[constants.CONVERSATION_SUMMARIES_COLLECTION]
+        await summaries_collection.update_one(
+            get_conversation_summary_key(call_id, transcript, summarizer_version),
+            {"$set": {"summary": summary, constants.UPDATED_AT_FIELD: datetime.now(timezone.utc)}},
+            upsert=True,
+        )
+    except Exception as e:
+        logger.error(f"Error while saving conversation summary of call {call_id}: {e}")
+
+
+async def get_cached_resume_text(content_document_id, content_version_id):
+    """Get the normalized text and sections of a Salesforce resume version, None when it was never extracted.
+
+    Texts normalized by another DOCUMENT_NORMALIZER_VERSION count as missing.
+    """
+    try:
+        resume_texts_collection = db[constants.RESUME_TEXTS_COLLECTION]
+        record = await resume_texts_collection.find_one(
+            {
+                "content_document_id": content_document_id,
+                "content_version_id": content_version_id,
+                "normalizer_version": DOCUMENT_NORMALIZER_VERSION,
+            }
+        )
+        return {"text": record["text"], "sections": record["sections"]} if record else None
+    except Exception as e:
+        logger.error(f"Error while reading resume text of document {content_document_id}: {e}")
+        return None
+
+
+async def save_resume_text(content_document_id, content_version_id, resume):
+    """Store the normalized text and sections of a Salesforce resume version, see document_utils.extract_resume."""
+    try:
+        resume_texts_collection = db[constants.RESUME_TEXTS_COLLECTION]
+        await resume_texts_collection.update_one(
+            {"content_document_id": content_document_id, "content_version_id": content_version_id},
+            {
+                "$set": {
+                    "text": resume["text"],
+                    "sections": resume["sections"],
+                    "normalizer_version": DOCUMENT_NORMALIZER_VERSION,
+                    constants.UPDATED_AT_FIELD: datetime.now(timezone.utc),
+                }
+            },
+            upsert=True,
+        )
+    except Exception as e:
+        logger.error(f"Error while saving resume text of document {content_document_id}: {e}")
+
+
+def get_analysis_result_key(job_description, resume_version, notes, conversation_summary, system_prompt_version):
+    """Content hash of every input of the final evaluation prompt."""
+    summaries = [f"{call_id}:{summary}" for call_id, summary in sorted(conversation_summary.items())]
+    return hash_content(
+        job_description,
+        resume_version["content_document_id"],
+        resume_version["content_version_id"],
+        notes,
+        *summaries,
+        system_prompt_version,
+    )
+
+
+def get_cached_analysis_result(result_key):
+    return analysis_result_cache.get(result_key)
+
+
+def save_analysis_result(result_key, result):
+    analysis_result_cache.set(result_key, result)
@@ -1,71 +1,581 @@
-from utils import helper_functions
+from utils import document_utils, helper_functions, llm_gateway, model_router, transcript_utils
+from utils.conversation_metrics import compute_conversation_metrics_batch, format_conversation_metrics
+from utils.deadline import Deadline
+from utils.token_utils import count_tokens
 from logging_module import logger
 from utils.thirdparty import gong_api_service
+from services import cache_service, gong_service
+from config import constants
+import asyncio
 import json
+import time
 
 
-async def analyze_candidate(job_description, call_id, salesforce_user_id):
-    """Analyze the candidate based on job description and transcript."""
+# Shared across requests so concurrent analyses cannot exceed the configured fan-out.
+summary_semaphore = asyncio.Semaphore(constants.SUMMARY_CONCURRENCY)
+batch_semaphore = asyncio.Semaphore(constants.BATCH_ANALYSIS_CONCURRENCY)
+
+
+async def summarize_with_limit(conversation_transcript):
+    async with summary_semaphore:
+        return await helper_functions.summarize_conversation(conversation_transcript)
+
+
+async def reduce_with_limit(partial_summaries):
+    if len(partial_summaries) == 1:
+        return {"response": partial_summaries[0], "status_code": 200}
+    async with summary_semaphore:
+        return await helper_functions.reduce_conversation_summaries(partial_summaries)
+
+
+async def summarize_transcript_within_budget(formatted_transcript):
+    """Summarize a transcript, map-reducing it when it is over TRANSCRIPT_CHUNK_TOKENS.
+
+    Chunks are cut on speaker turns and summarized concurrently, the partial summaries are
+    then reduced, in several rounds if they do not fit the budget together.
+    """
+    chunks = helper_functions.split_transcript(formatted_transcript, constants.TRANSCRIPT_CHUNK_TOKENS)
+    if len(chunks) == 1:
+        return await summarize_with_limit(chunks[0])
+
+    logger.info(f"Summarizing long transcript in {len(chunks)} chunks")
+    summarized_chunk_responses = await asyncio.gather(*(summarize_with_limit(chunk) for chunk in chunks))
+    for summarized_chunk_response in summarized_chunk_responses:
+        if summarized_chunk_response.get("status_code") != 200:
+            return summarized_chunk_response
+    partial_summaries = [response["response"] for response in summarized_chunk_responses]
+
+    while len(partial_summaries) > 1:
+        groups = helper_functions.group_texts_by_tokens(partial_summaries, constants.TRANSCRIPT_CHUNK_TOKENS)
+        if len(groups) == len(partial_summaries):
+            # Every summary fills the budget on its own, merge them pairwise to keep making progress
+            groups = [partial_summaries[index:index + 2] for index in range(0, len(partial_summaries), 2)]
+        reduced_responses = await asyncio.gather(
+            *(reduce_with_limit(group) for group in groups)
+        )
+        for reduced_response in reduced_responses:
+            if reduced_response.get("status_code") != 200:
+                return reduced_response
+        partial_summaries = [response["response"] for response in reduced_responses]
+    return {"response": partial_summaries[0], "status_code": 200}
+
+
+def estimate_summary_prompt_tokens(conversation_transcript, system_prompt=helper_functions.SUMMARIZER_SYSTEM_PROMPT):
+    return llm_gateway.estimate_prompt_tokens(
+        [{"role": "system", "content": system_prompt}, {"role": "user", "content": conversation_transcript}]
+    )
+
+
+def plan_transcript_summary(formatted_transcript, summary_tokens):
+    """List the requests summarize_transcript_within_budget would send for a transcript, without sending them.
+
+    Partial summaries are assumed to take summary_tokens each.
+    :return: "requests", the prompt tokens of each request, and "rounds", how many of them run one after the other.
+    """
+    chunks = helper_functions.split_transcript(formatted_transcript, constants.TRANSCRIPT_CHUNK_TOKENS)
+    requests = [estimate_summary_prompt_tokens(chunk) for chunk in chunks]
+    rounds = 1
+    partial_summaries = len(chunks)
+    summaries_per_group = max(2, constants.TRANSCRIPT_CHUNK_TOKENS // (summary_tokens + 1))
+    reduce_system_tokens = estimate_summary_prompt_tokens("", helper_functions.SUMMARY_REDUCE_SYSTEM_PROMPT)
+    while partial_summaries > 1:
+        group_sizes = [
+            min(summaries_per_group, partial_summaries - start)
+            for start in range(0, partial_summaries, summaries_per_group)
+        ]
+        # A group of one summary is passed through without a request, see reduce_with_limit
+        requests.extend(
+            reduce_system_tokens + min(group_size * summary_tokens, constants.TRANSCRIPT_CHUNK_TOKENS)
+            for group_size in group_sizes
+            if group_size > 1
+        )
+        partial_summaries = len(group_sizes)
+        rounds += 1
+    return {"requests": requests, "rounds": rounds}
+
+
+async def load_call_transcript(call_transcript, speaker_labels=None):
+    """Format a single Gong call transcript and look up its stored summary, None when there is none."""
+    formatted_transcript_response = transcript_utils.parse_transcript(
+        call_transcript, speaker_labels, compact=constants.TRANSCRIPT_COMPACTION_ENABLED
+    )
+    if formatted_transcript_response.get("status_code") == 500:
+        return formatted_transcript_response
+    call_id = call_transcript["callId"]
+    formatted_transcript = formatted_transcript_response["transcript"]
+    compaction = None
+    if constants.TRANSCRIPT_COMPACTION_ENABLED:
+        original_transcript = transcript_utils.parse_transcript(call_transcript, speaker_labels)["transcript"]
+        compaction = transcript_utils.get_compaction_report(original_transcript, formatted_transcript)
+        logger.info(f"Transcript compaction saved {compaction['tokens_saved']} tokens for call_id {call_id}")
+    cached_summary = await cache_service.get_cached_conversation_summary(
+        call_id, formatted_transcript, helper_functions.SUMMARIZER_PROMPT_VERSION
+    )
+    return {
+        "call_id": call_id,
+        "transcript": formatted_transcript,
+        "compaction": compaction,
+        "cached_summary": cached_summary,
+        "status_code": 200,
+    }
+
+
+async def summarize_packed_transcripts(loaded_transcripts):
+    """Summarize several short transcripts in one request, one response per transcript in the same order.
+
+    A call whose summary is missing from the packed answer, or every call when the request
+    fails, is summarized on its own instead.
+    """
+    async with summary_semaphore:
+        packed_response = await helper_functions.summarize_packed_conversations(
+            {loaded["call_id"]: loaded["transcript"] for loaded in loaded_transcripts}
+        )
+    summaries = packed_response["response"] if packed_response.get("status_code") == 200 else {}
+    unpacked_transcripts = [loaded for loaded in loaded_transcripts if loaded["call_id"] not in summaries]
+    if unpacked_transcripts:
+        logger.warning(
+            f"Packed summarization missed {len(unpacked_transcripts)} of {len(loaded_transcripts)} calls, "
+            "summarizing them individually"
+        )
+    unpacked_responses = await asyncio.gather(
+        *(summarize_transcript_within_budget(loaded["transcript"]) for loaded in unpacked_transcripts)
+    )
+    responses_by_call_id = {
+        loaded["call_id"]: response for loaded, response in zip(unpacked_transcripts, unpacked_responses)
+    }
+    for call_id, summary in summaries.items():
+        responses_by_call_id[call_id] = {"response": summary, "packed": True, "status_code": 200}
+    return [responses_by_call_id[loaded["call_id"]] for loaded in loaded_transcripts]
+
+
+async def summarize_call_transcripts(
+    call_transcripts, on_event=None, speaker_labels=None, summary_plan=None, summary_timeout=None
+):
+    """Summarize the Gong transcripts of a candidate's calls, one response per transcript in the same order.
+
+    Stored summaries are reused. Transcripts under PACKED_SUMMARY_MAX_CALL_TOKENS are packed into
+    shared requests of up to PACKED_SUMMARY_MAX_TOKENS, longer ones are summarized on their own.
+    Each call is reported with "call_summarized" as soon as its summary is available.
+    speaker_labels holds the speaker labels of each call by call id.
+
+    For a dry run, pass a summary_plan list: the requests each summary would need are appended
+    to it instead of being sent, and the summaries that are not stored yet are left empty.
+    A summary not done within summary_timeout seconds is given up, with a 504 response.
+    """
+    speaker_labels = speaker_labels or {}
+    loaded_transcripts = await asyncio.gather(
+        *(
+            load_call_transcript(call_transcript, speaker_labels.get(call_transcript["callId"]))
+            for call_transcript in call_transcripts
+        )
+    )
+    responses = [None] * len(loaded_transcripts)
+
+    async def complete(index, summarized_conversation_response, cached=False):
+        responses[index] = summarized_conversation_response
+        if summarized_conversation_response.get("status_code") != 200:
+            return
+        loaded = loaded_transcripts[index]
+        summarized_conversation_response["compaction"] = loaded["compaction"]
+        if not cached and summary_plan is None:
+            await cache_service.save_conversation_summary(
+                loaded["call_id"],
+                loaded["transcript"],
+                helper_functions.SUMMARIZER_PROMPT_VERSION,
+                summarized_conversation_response["response"],
+            )
+        await emit_event(
+            on_event,
+            "call_summarized",
+            {
+                "call_id": loaded["call_id"],
+                "cached": cached,
+                "packed": summarized_conversation_response.get("packed", False),
+                "compaction": loaded["compaction"],
+            },
+        )
+
+    short_indexes = []
+    units = []
+    for index, loaded in enumerate(loaded_transcripts):
+        if loaded.get("status_code") != 200:
+            responses[index] = loaded
+        elif loaded["cached_summary"] is not None:
+            logger.info(f"Using cached conversation summary for call_id {loaded['call_id']}")
+            await complete(index, {"response": loaded["cached_summary"], "cached": True, "status_code": 200}, True)
+        elif count_tokens(loaded["transcript"]) <= constants.PACKED_SUMMARY_MAX_CALL_TOKENS:
+            short_indexes.append(index)
+        else:
+            units.append([index])
+
+    packed_sections = [
+        helper_functions.format_packed_transcript(loaded_transcripts[index]["call_id"], loaded_transcripts[index]["transcript"])
+        for index in short_indexes
+    ]
+    position = 0
+    for group in helper_functions.group_texts_by_tokens(
+        packed_sections, constants.PACKED_SUMMARY_MAX_TOKENS, constants.PACKED_SUMMARY_MAX_CALLS
+    ):
+        units.append(short_indexes[position:position + len(group)])
+        position += len(group)
+
+    async def summarize_loaded_unit(indexes):
+        if len(indexes) == 1:
+            return [await summarize_transcript_within_budget(loaded_transcripts[indexes[0]]["transcript"])]
+        logger.info(f"Summarizing {len(indexes)} short transcripts in one request")
+        return await summarize_packed_transcripts([loaded_transcripts[index] for index in indexes])
+
+    async def summarize_unit(indexes):
+        if summary_plan is not None:
+            summary_plan.append(plan_summary_unit([loaded_transcripts[index] for index in indexes]))
+            unit_responses = [{"response": "", "planned": True, "status_code": 200} for _ in indexes]
+        else:
+            try:
+                unit_responses = await asyncio.wait_for(summarize_loaded_unit(indexes), summary_timeout)
+            except asyncio.TimeoutError:
+                call_ids = [loaded_transcripts[index]["call_id"] for index in indexes]
+                logger.warning(f"Summarizing call_id {call_ids} timed out after {summary_timeout:.1f} seconds")
+                unit_responses = [get_timeout_response("summary", summary_timeout) for _ in indexes]
+        for index, summarized_conversation_response in zip(indexes, unit_responses):
+            await complete(index, summarized_conversation_response)
+
+    await asyncio.gather(*(summarize_unit(indexes) for indexes in units))
+    return responses
+
+
+def plan_summary_unit(loaded_transcripts):
+    """The summarization requests of one unit of summarize_call_transcripts, a long transcript or a pack of short ones."""
+    summary_tokens = (
+        model_router.get_stage_averages(model_router.STAGE_SUMMARIZE)["average_completion_tokens"]
+        or constants.LLM_ESTIMATED_COMPLETION_TOKENS
+    )
+    call_ids = [loaded["call_id"] for loaded in loaded_transcripts]
+    if len(loaded_transcripts) == 1:
+        plan = plan_transcript_summary(loaded_transcripts[0]["transcript"], summary_tokens)
+    else:
+        packed_transcripts = "\n\n".join(
+            helper_functions.format_packed_transcript(loaded["call_id"], loaded["transcript"])
+            for loaded in loaded_transcripts
+        )
+        plan = {
+            "requests": [
+                estimate_summary_prompt_tokens(packed_transcripts, helper_functions.PACKED_SUMMARIZER_SYSTEM_PROMPT)
+            ],
+            "rounds": 1,
+        }
+    # A summary is assumed no longer than the transcript it summarizes
+    planned_summary_tokens = sum(min(summary_tokens, count_tokens(loaded["transcript"])) for loaded in loaded_transcripts)
+    return {"call_ids": call_ids, **plan, "summary_tokens": planned_summary_tokens}
+
+
+async def emit_event(on_event, event, data):
+    """Report pipeline progress to on_event, an optional async callable taking (event, data)."""
+    if on_event:
+        await on_event(event, data)
+
+
+def get_timeout_response(stage_name, timeout):
+    return {
+        "error": f"The {stage_name} stage did not finish within {timeout:.1f} seconds.",
+        "timed_out": True,
+        "status_code": 504,
+    }
+
+
+async def timed_stage(stage_name, coroutine, timings, timeout=None):
+    """Await a pipeline stage and record its wall time in seconds under stage_name.
+
+    A stage still running after timeout seconds is cancelled and answered with a 504 response.
+    """
+    start_time = time.perf_counter()
     try:
-        # Salesforce Resume
-        logger.info(f"Fetching resume content for candidate with salesforce_user_id {salesforce_user_id}")
-        resume_response = await helper_functions.get_content_of_pdf_from_salesforce_user(salesforce_user_id)
-        if resume_response.get("status_code") != 200:
-            return resume_response       
-        input_resume = resume_response["file_content"]
+        return await asyncio.wait_for(coroutine, timeout)
+    except asyncio.TimeoutError:
+        logger.warning(f"The {stage_name} stage timed out after {timeout:.1f} seconds")
+        return get_timeout_response(stage_name, timeout)
+    finally:
+        timings[stage_name] = round(time.perf_counter() - start_time, 3)
+
+
+async def fetch_resume_stage(salesforce_user_id, on_event=None):
+    """Fetch the candidate resume text from Salesforce."""
+    logger.info(f"Fetching resume content for candidate with salesforce_user_id {salesforce_user_id}")
+    resume_response = await helper_functions.get_content_of_pdf_from_salesforce_user(salesforce_user_id)
+    if resume_response.get("status_code") == 200:
         logger.info(f"Resume content fetched successfully for candidate with salesforce_user_id {salesforce_user_id}")
+        await emit_event(on_event, "resume_fetched", {"cached": resume_response.get("cached", False)})
+    return resume_response
 
 
-        # Salesforce Notes
-        logger.info(f"Fetching notes content for candidate with salesforce_user_id {salesforce_user_id}")
-        notes_response = await helper_functions.get_salesforce_user_notes_first_record(salesforce_user_id)
-        if notes_response.get("status_code") != 200:
-            notes_response["notes"] = ""
-        notes = notes_response["notes"]
-        logger.info(f"Notes content fetched successfully for candidate with salesforce_user_id {salesforce_user_id}")
-        
-        # Gong Transcript
-        conversation_summary = {}
-        if call_id:
-            logger.info(f"Analyzing candidate with call_id {call_id}")
-            transcript = await gong_api_service.get_call_transcript_by_call_id(call_id)
-            if transcript.get("status_code") == 500:
-                return transcript
-            formatted_transcript = ""
-            call_transcripts = transcript["response"]["callTranscripts"]
-
-            for i in range(len(call_transcripts)):
-                transcript = call_transcripts[i]
-                formatted_transcript_response = helper_functions.parse_transcript(transcript)
-                if formatted_transcript_response.get("status_code") == 500:
-                    continue
-                # Summnarize the transcript
-                summarized_conversation_response = await helper_functions.summarize_conversation(formatted_transcript_response["transcript"])
-                if summarized_conversation_response.get("status_code") == 500:
-                    continue
-
-                formatted_transcript += summarized_conversation_response["response"]
-                conversation_summary[call_transcripts[i]["callId"]] = summarized_conversation_response["response"]
-            input_transcript = formatted_transcript
-            logger.info(f"Transcript fetched successfully for candidate with call_id {call_id}")
-        else:
-            input_transcript = ""
+async def fetch_notes_stage(salesforce_user_id, on_event=None):
+    """Fetch the first Salesforce note of the candidate, empty when there is none."""
+    logger.info(f"Fetching notes content for candidate with salesforce_user_id {salesforce_user_id}")
+    notes_response = await helper_functions.get_salesforce_user_notes_first_record(salesforce_user_id)
+    if notes_response.get("status_code") != 200:
+        notes_response["notes"] = ""
+    logger.info(f"Notes content fetched successfully for candidate with salesforce_user_id {salesforce_user_id}")
+    await emit_event(on_event, "notes_fetched", {"found": bool(notes_response["notes"])})
+    return notes_response
 
-        prompt = helper_functions.create_prompt(job_description, input_transcript, input_resume, notes)
-        system_prompt = helper_functions.get_system_prompt()
-        response = helper_functions.get_gpt_response(prompt, system_prompt)
-        if response.get("status_code") == 500:
-            return response
-        raw_response = response.get('response', '')
-        cleaned_json_string = raw_response.strip('```json').strip('```').strip()
-        formatted_response = json.loads(cleaned_json_string)
+
+async def fetch_transcript_stage(call_id, on_event=None, summary_plan=None, deadline=None):
+    """Fetch the Gong transcripts of the calls and summarize each of them.
+
+    With a summary_plan list, nothing is summarized or stored, see summarize_call_transcripts.
+    The fetch and every summary have their own timeout within the deadline, the calls whose
+    summary fails or times out are left out and listed in "omissions".
+    """
+    if not call_id:
         return {
-            "response": formatted_response,
-            "call_id": call_id,
-            "salesforce_user_id": salesforce_user_id,
-            "conversation_summary": conversation_summary,
+            "transcript": "",
+            "conversation_summary": {},
+            "transcript_compaction": {},
+            "conversation_metrics": {},
+            "omissions": [],
             "status_code": 200,
-            "message": "Candidate analysis completed successfully.",
+        }
+
+    deadline = deadline or Deadline(constants.ANALYSIS_DEADLINE_SECONDS)
+    logger.info(f"Analyzing candidate with call_id {call_id}")
+    fetch_timeout = deadline.stage_timeout(constants.TRANSCRIPT_FETCH_TIMEOUT_SECONDS, constants.EVALUATION_RESERVED_SECONDS)
+    try:
+        transcript, parties = await asyncio.wait_for(
+            asyncio.gather(
+                gong_api_service.get_call_transcript_by_call_id(call_id),
+                gong_api_service.get_call_parties_by_call_id(call_id),
+            ),
+            fetch_timeout,
+        )
+    except asyncio.TimeoutError:
+        logger.warning(f"Fetching the transcripts of call_id {call_id} timed out after {fetch_timeout:.1f} seconds")
+        return get_timeout_response("transcript", fetch_timeout)
+    if transcript.get("status_code") != 200:
+        return transcript
+    formatted_transcript = ""
+    conversation_summary = {}
+    transcript_compaction = {}
+    omissions = []
+    call_transcripts = transcript["response"]["callTranscripts"]
+    speaker_labels = {}
+    if parties.get("status_code") == 200:
+        speaker_labels = {
+            call["metaData"]["id"]: transcript_utils.get_speaker_labels(call.get("parties"))
+            for call in parties["response"].get("calls", [])
+        }
+    else:
+        logger.warning(f"Could not fetch the parties of call_id {call_id}, speakers will not be named")
+    speaker_labels = {
+        call_transcript["callId"]: transcript_utils.complete_speaker_labels(
+            call_transcript, speaker_labels.get(call_transcript["callId"])
+        )
+        for call_transcript in call_transcripts
+    }
+    conversation_metrics = compute_conversation_metrics_batch(call_transcripts, speaker_labels)
+
+    # Summarize the transcripts concurrently, bounded by summary_semaphore, while the metrics are stored
+    summarized_conversation_responses, _ = await asyncio.gather(
+        summarize_call_transcripts(
+            call_transcripts,
+            on_event,
+            speaker_labels,
+            summary_plan,
+            deadline.stage_timeout(constants.CALL_SUMMARY_TIMEOUT_SECONDS, constants.EVALUATION_RESERVED_SECONDS),
+        ),
+        gong_service.save_conversation_metrics(conversation_metrics if summary_plan is None else {}),
+    )
+    for call_transcript, summarized_conversation_response in zip(call_transcripts, summarized_conversation_responses):
+        if summarized_conversation_response.get("status_code") != 200:
+            omissions.append(
+                {
+                    "stage": "summary",
+                    "call_id": call_transcript["callId"],
+                    "reason": "timeout" if summarized_conversation_response.get("timed_out") else "error",
+                }
+            )
+            continue
+
+        formatted_transcript += summarized_conversation_response["response"]
+        conversation_summary[call_transcript["callId"]] = summarized_conversation_response["response"]
+        if summarized_conversation_response.get("compaction"):
+            transcript_compaction[call_transcript["callId"]] = summarized_conversation_response["compaction"]
+    logger.info(f"Transcript fetched successfully for candidate with call_id {call_id}")
+    return {
+        "transcript": formatted_transcript,
+        "conversation_summary": conversation_summary,
+        "transcript_compaction": transcript_compaction,
+        "conversation_metrics": conversation_metrics,
+        "omissions": omissions,
+        "status_code": 200,
+    }
+
+
+def parse_analysis_response(raw_response):
+    """Parse the JSON evaluation returned by the model, tolerating a markdown code fence."""
+    cleaned_json_string = raw_response.strip('```json').strip('```').strip()
+    return json.loads(cleaned_json_string)
+
+
+async def prepare_analysis(
+    job_description,
+    call_id,
+    salesforce_user_id,
+    timings,
+    on_event=None,
+    prompt_preamble=None,
+    system_prompt=None,
+    summary_plan=None,
+    deadline=None,
+):
+    """Gather every input of the final evaluation and build its prompts.
+
+    Batch analyses pass the prompt_preamble and system_prompt they built once for all candidates.
+    Dry runs pass a summary_plan list, see fetch_transcript_stage.
+    Every stage has a timeout within the deadline. The resume and the transcripts are required,
+    the notes and single call summaries are left out when they miss theirs, see "omissions".
+    """
+    deadline = deadline or Deadline(constants.ANALYSIS_DEADLINE_SECONDS)
+    reserved_seconds = constants.EVALUATION_RESERVED_SECONDS
+    # Salesforce resume, Salesforce notes and Gong transcripts are independent, fetch them together
+    resume_response, notes_response, transcript_response = await asyncio.gather(
+        timed_stage(
+            "resume",
+            fetch_resume_stage(salesforce_user_id, on_event),
+            timings,
+            deadline.stage_timeout(constants.RESUME_STAGE_TIMEOUT_SECONDS, reserved_seconds),
+        ),
+        timed_stage(
+            "notes",
+            fetch_notes_stage(salesforce_user_id, on_event),
+            timings,
+            deadline.stage_timeout(constants.NOTES_STAGE_TIMEOUT_SECONDS, reserved_seconds),
+        ),
+        timed_stage("transcript", fetch_transcript_stage(call_id, on_event, summary_plan, deadline), timings),
+    )
+    if resume_response.get("status_code") != 200:
+        return resume_response
+    if transcript_response.get("status_code") != 200:
+        return transcript_response
+    omissions = list(transcript_response["omissions"])
+    if notes_response.get("timed_out"):
+        notes_response["notes"] = ""
+        omissions.append({"stage": "notes", "reason": "timeout"})
+    # The structured form keeps every resume section, within the resume's share of the prompt
+    input_resume = document_utils.format_structured_document(
+        resume_response["sections"], constants.RESUME_PROMPT_MAX_TOKENS
+    )
+    notes = notes_response["notes"]
+    input_transcript = transcript_response["transcript"]
+    conversation_summary = transcript_response["conversation_summary"]
+
+    result_key = cache_service.get_analysis_result_key(
+        job_description, resume_response, notes, conversation_summary, helper_functions.SYSTEM_PROMPT_VERSION
+    )
+    prompt = helper_functions.create_prompt(
+        job_description,
+        input_transcript,
+        input_resume,
+        notes,
+        prompt_preamble,
+        format_conversation_metrics(transcript_response["conversation_metrics"]),
+    )
+    system_prompt = system_prompt or helper_functions.get_system_prompt()
+    await emit_event(on_event, "prompt_built", {"prompt_characters": len(prompt)})
+    return {
+        "prompt": prompt,
+        "system_prompt": system_prompt,
+        "result_key": result_key,
+        "conversation_summary": conversation_summary,
+        "transcript_compaction": transcript_response["transcript_compaction"],
+        "conversation_metrics": transcript_response["conversation_metrics"],
+        "omissions": omissions,
+        "status_code": 200,
+    }
+
+
+def build_analysis_result(formatted_response, call_id, salesforce_user_id, conversation_summary, conversation_metrics):
+    return {
+        "response": formatted_response,
+        "call_id": call_id,
+        "salesforce_user_id": salesforce_user_id,
+        "conversation_summary": conversation_summary,
+        "conversation_metrics": conversation_metrics,
+        "status_code": 200,
+        "message": "Candidate analysis completed successfully.",
+    }
+
+
+async def analyze_candidate(
+    job_description,
+    call_id,
+    salesforce_user_id,
+    force_refresh=False,
+    prompt_preamble=None,
+    system_prompt=None,
+    on_event=None,
+):
+    """Analyze the candidate based on job description and transcript.
+
+    Identical inputs are answered from the analysis result cache unless force_refresh is set.
+    The whole analysis runs within ANALYSIS_DEADLINE_SECONDS. Inputs left out to meet it are
+    listed in "omissions" and the result is flagged "partial", and not cached.
+    """
+    try:
+        timings = {}
+        start_time = time.perf_counter()
+        deadline = Deadline(constants.ANALYSIS_DEADLINE_SECONDS)
+
+        analysis = await prepare_analysis(
+            job_description, call_id, salesforce_user_id, timings, on_event,
+            prompt_preamble=prompt_preamble, system_prompt=system_prompt, deadline=deadline,
+        )
+        if analysis.get("status_code") != 200:
+            return analysis
+
+        cached_result = None if force_refresh else cache_service.get_cached_analysis_result(analysis["result_key"])
+        if cached_result is not None:
+            logger.info(f"Using cached analysis result for salesforce_user_id {salesforce_user_id}")
+            timings["total"] = round(time.perf_counter() - start_time, 3)
+            return {
+                **cached_result,
+                "call_id": call_id,
+                "timings": timings,
+                "transcript_compaction": analysis["transcript_compaction"],
+                "omissions": analysis["omissions"],
+                "partial": bool(analysis["omissions"]),
+                "cached": True,
+            }
+
+        response = await timed_stage(
+            "evaluation",
+            helper_functions.get_gpt_response(
+                analysis["prompt"], analysis["system_prompt"], hedge=constants.LLM_HEDGING_ENABLED
+            ),
+            timings,
+            deadline.remaining(),
+        )
+        if response.get("status_code") != 200:
+            return response
+        formatted_response = parse_analysis_response(response.get('response', ''))
+        result = build_analysis_result(
+            formatted_response,
+            call_id,
+            salesforce_user_id,
+            analysis["conversation_summary"],
+            analysis["conversation_metrics"],
+        )
+        if not analysis["omissions"]:
+            cache_service.save_analysis_result(analysis["result_key"], result)
+        timings["total"] = round(time.perf_counter() - start_time, 3)
+        prompt_cache = model_router.get_prompt_cache_usage(
+            response.get("prompt_tokens", 0), response.get("cached_prompt_tokens", 0)
+        )
+        return {
+            **result,
+            "timings": timings,
+            "transcript_compaction": analysis["transcript_compaction"],
+            "omissions": analysis["omissions"],
+            "partial": bool(analysis["omissions"]),
+            "prompt_cache": prompt_cache,
         }
     except Exception as e:
         import traceback
@@ -77,11 +587,315 @@ async def analyze_candidate(job_description, call_id, salesforce_user_id):
         }
 
 
+async def analyze_candidates_batch(job_description, candidates, force_refresh=False):
+    """Analyze many candidates against one job description.
+
+    Per-candidate pipelines share batch_semaphore and summary_semaphore with every other
+    request and reuse the same prompt preamble and system prompt.
+    """
+    try:
+        if len(candidates) > constants.BATCH_ANALYSIS_MAX_CANDIDATES:
+            return {
+                "response": f"A batch can analyze at most {constants.BATCH_ANALYSIS_MAX_CANDIDATES} candidates.",
+                "status_code": 400,
+            }
+        start_time = time.perf_counter()
+        # Bulk screening must not hold back interactive analyses at the LLM gateway
+        priority_token = llm_gateway.llm_priority.set(llm_gateway.PRIORITY_BACKGROUND)
+        prompt_preamble = helper_functions.create_prompt_preamble(job_description)
+        system_prompt = helper_functions.get_system_prompt()
+
+        async def analyze_batch_candidate(candidate):
+            async with batch_semaphore:
+                return await analyze_candidate(
+                    job_description,
+                    candidate.call_id,
+                    candidate.salesforce_user_id,
+                    force_refresh,
+                    prompt_preamble=prompt_preamble,
+                    system_prompt=system_prompt,
+                )
+
+        try:
+            results = await asyncio.gather(*(analyze_batch_candidate(candidate) for candidate in candidates))
+        finally:
+            llm_gateway.llm_priority.reset(priority_token)
+        for candidate, result in zip(candidates, results):
+            result.setdefault("salesforce_user_id", candidate.salesforce_user_id)
+
+        stage_timings = {}
+        for result in results:
+            for stage_name, seconds in result.get("timings", {}).items():
+                stage_timings.setdefault(stage_name, []).append(seconds)
+        succeeded = sum(1 for result in results if result.get("status_code") == 200)
+        evaluated = [result["prompt_cache"] for result in results if "prompt_cache" in result]
+        return {
+            "response": results,
+            "succeeded": succeeded,
+            "failed": len(results) - succeeded,
+            "cached": sum(1 for result in results if result.get("cached")),
+            "prompt_cache": model_router.get_prompt_cache_usage(
+                sum(usage["prompt_tokens"] for usage in evaluated),
+                sum(usage["cached_prompt_tokens"] for usage in evaluated),
+            ),
+            "timings": {
+                "total": round(time.perf_counter() - start_time, 3),
+                "stages": {
+                    stage_name: {
+                        "mean": round(sum(seconds) / len(seconds), 3),
+                        "max": max(seconds),
+                        "sum": round(sum(seconds), 3),
+                    }
+                    for stage_name, seconds in stage_timings.items()
+                },
+            },
+            "status_code": 200,
+        }
+    except Exception as e:
+        logger.error(f"Error in batch candidate analysis: {e}")
+        return {
+            "response": f"An error occurred while analyzing the candidates.{e}",
+            "status_code": 500,
+        }
+
+
+def estimate_stage_latency_seconds(stage, requests):
+    """Estimate the wall time of requests run one after the other from the stage's recent calls, None before any."""
+    average_latency_seconds = model_router.get_stage_averages(stage)["average_latency_seconds"]
+    if average_latency_seconds is None:
+        return None
+    return round(requests * average_latency_seconds, 3)
+
+
+async def estimate_analysis(job_description, call_id, salesforce_user_id):
+    """Dry run of analyze_candidate: fetch its inputs and build its prompts, without calling the model.
+
+    Resume, notes and transcripts are fetched or read from cache like a real analysis, but
+    summaries missing from the cache are only planned, and nothing is stored.
+    Latencies are estimated from the recently observed calls of each stage.
+    """
+    try:
+        timings = {}
+        summary_plan = []
+        start_time = time.perf_counter()
+        analysis = await prepare_analysis(job_description, call_id, salesforce_user_id, timings, summary_plan=summary_plan)
+        if analysis.get("status_code") != 200:
+            return analysis
+        fetch_seconds = round(time.perf_counter() - start_time, 3)
+
+        summarize_requests = [prompt_tokens for unit in summary_plan for prompt_tokens in unit["requests"]]
+        # Units run concurrently within summary_semaphore, the reduce rounds of a unit one after the other
+        summarize_rounds = max(
+            [unit["rounds"] for unit in summary_plan] + [-(-len(summarize_requests) // constants.SUMMARY_CONCURRENCY)]
+        )
+        summarize_completion_tokens = sum(unit["summary_tokens"] for unit in summary_plan)
+        # A planned summary is still empty, the evaluation prompt grows by the summary it will hold
+        evaluate_prompt_tokens = summarize_completion_tokens + llm_gateway.estimate_prompt_tokens(
+            [{"role": "system", "content": analysis["system_prompt"]}, {"role": "user", "content": analysis["prompt"]}]
+        )
+        # MAX_PROMPT_TOKENS bounds the user message only, as in create_prompt
+        user_prompt_tokens = summarize_completion_tokens + count_tokens(analysis["prompt"])
+        result_cached = not summary_plan and cache_service.get_cached_analysis_result(analysis["result_key"]) is not None
+        evaluate_requests = 0 if result_cached else 1
+        evaluate_completion_tokens = evaluate_requests * (
+            model_router.get_stage_averages(model_router.STAGE_EVALUATE)["average_completion_tokens"]
+            or constants.LLM_ESTIMATED_COMPLETION_TOKENS
+        )
+
+        stages = {
+            model_router.STAGE_SUMMARIZE: {
+                "requests": len(summarize_requests),
+                "prompt_tokens": sum(summarize_requests),
+                "estimated_completion_tokens": summarize_completion_tokens,
+                "estimated_seconds": estimate_stage_latency_seconds(model_router.STAGE_SUMMARIZE, summarize_rounds)
+                if summarize_requests else 0,
+            },
+            model_router.STAGE_EVALUATE: {
+                "requests": evaluate_requests,
+                "prompt_tokens": evaluate_prompt_tokens if evaluate_requests else 0,
+                "estimated_completion_tokens": evaluate_completion_tokens,
+                "estimated_seconds": estimate_stage_latency_seconds(model_router.STAGE_EVALUATE, evaluate_requests)
+                if evaluate_requests else 0,
+            },
+        }
+        stage_seconds = [stage["estimated_seconds"] for stage in stages.values()]
+        return {
+            "call_id": call_id,
+            "salesforce_user_id": salesforce_user_id,
+            "stages": stages,
+            "llm_calls": sum(stage["requests"] for stage in stages.values()),
+            "total_tokens": sum(
+                stage["prompt_tokens"] + stage["estimated_completion_tokens"] for stage in stages.values()
+            ),
+            "cached_summaries": len(call_id or []) - sum(len(unit["call_ids"]) for unit in summary_plan),
+            "result_cached": result_cached,
+            "exceeds_prompt_budget": user_prompt_tokens > constants.MAX_PROMPT_TOKENS,
+            "transcript_compaction": analysis["transcript_compaction"],
+            "omissions": analysis["omissions"],
+            "timings": {
+                "fetch": fetch_seconds,
+                "stages": timings,
+                "estimated_total": None if None in stage_seconds else round(fetch_seconds + sum(stage_seconds), 3),
+            },
+            "status_code": 200,
+        }
+    except Exception as e:
+        logger.error(f"Error in estimating candidate analysis: {e}")
+        return {
+            "response": f"An error occurred while estimating the candidate analysis.{e}",
+            "status_code": 500,
+        }
+
+
+async def estimate_candidates_batch(job_description, candidates):
+    """Dry run of analyze_candidates_batch, see estimate_analysis.
+
+    The estimated wall time assumes batch_semaphore lets BATCH_ANALYSIS_CONCURRENCY candidates run at once.
+    """
+    try:
+        if len(candidates) > constants.BATCH_ANALYSIS_MAX_CANDIDATES:
+            return {
+                "response": f"A batch can analyze at most {constants.BATCH_ANALYSIS_MAX_CANDIDATES} candidates.",
+                "status_code": 400,
+            }
+
+        async def estimate_batch_candidate(candidate):
+            async with batch_semaphore:
+                return await estimate_analysis(job_description, candidate.call_id, candidate.salesforce_user_id)
+
+        results = await asyncio.gather(*(estimate_batch_candidate(candidate) for candidate in candidates))
+        for candidate, result in zip(candidates, results):
+            result.setdefault("salesforce_user_id", candidate.salesforce_user_id)
+        estimated = [result for result in results if result.get("status_code") == 200]
+        candidate_seconds = [result["timings"]["estimated_total"] for result in estimated]
+        estimated_total = None
+        if candidate_seconds and None not in candidate_seconds:
+            estimated_total = round(
+                max(max(candidate_seconds), sum(candidate_seconds) / constants.BATCH_ANALYSIS_CONCURRENCY), 3
+            )
+        return {
+            "response": results,
+            "succeeded": len(estimated),
+            "failed": len(results) - len(estimated),
+            "llm_calls": sum(result["llm_calls"] for result in estimated),
+            "total_tokens": sum(result["total_tokens"] for result in estimated),
+            "exceeding_prompt_budget": [
+                result["salesforce_user_id"] for result in estimated if result["exceeds_prompt_budget"]
+            ],
+            "timings": {"estimated_total": estimated_total},
+            "status_code": 200,
+        }
+    except Exception as e:
+        logger.error(f"Error in estimating batch candidate analysis: {e}")
+        return {
+            "response": f"An error occurred while estimating the candidate analyses.{e}",
+            "status_code": 500,
+        }
+
+
+async def stream_analyze_candidate(job_description, call_id, salesforce_user_id, force_refresh=False):
+    """Analyze the candidate as a stream of server-sent events.
+
+    Emits one event per completed stage, then the model output token by token and finally
+    the same result analyze_candidate returns as the "result" event.
+    The stream runs within ANALYSIS_DEADLINE_SECONDS like analyze_candidate, an evaluation
+    still streaming when it expires ends with an "error" event.
+    """
+    timings = {}
+    start_time = time.perf_counter()
+    deadline = Deadline(constants.ANALYSIS_DEADLINE_SECONDS)
+    events = asyncio.Queue()
+
+    async def on_event(event, data):
+        await events.put((event, data))
+
+    async def run_preparation():
+        try:
+            return await prepare_analysis(
+                job_description, call_id, salesforce_user_id, timings, on_event, deadline=deadline
+            )
+        finally:
+            await events.put(None)
+
+    preparation = asyncio.create_task(run_preparation())
+    try:
+        while True:
+            try:
+                stage_event = await asyncio.wait_for(events.get(), timeout=constants.SSE_HEARTBEAT_SECONDS)
+            except asyncio.TimeoutError:
+                # SSE comment line, keeps proxies from closing an idle connection
+                yield ": keep-alive\n\n"
+                continue
+            if stage_event is None:
+                break
+            yield helper_functions.format_sse_event(*stage_event)
+
+        analysis = await preparation
+        if analysis.get("status_code") != 200:
+            yield helper_functions.format_sse_event("error", analysis)
+            return
+
+        cached_result = None if force_refresh else cache_service.get_cached_analysis_result(analysis["result_key"])
+        if cached_result is not None:
+            timings["total"] = round(time.perf_counter() - start_time, 3)
+            yield helper_functions.format_sse_event(
+                "result", {**cached_result, "call_id": call_id, "timings": timings, "cached": True}
+            )
+            return
+
+        evaluation_start_time = time.perf_counter()
+        evaluation_timeout = deadline.remaining()
+        raw_response = ""
+        tokens = helper_functions.stream_gpt_response(analysis["prompt"], analysis["system_prompt"])
+        try:
+            while True:
+                try:
+                    content = await asyncio.wait_for(tokens.__anext__(), timeout=deadline.remaining())
+                except StopAsyncIteration:
+                    break
+                except asyncio.TimeoutError:
+                    logger.warning(f"The evaluation stage timed out after {evaluation_timeout:.1f} seconds")
+                    yield helper_functions.format_sse_event(
+                        "error", get_timeout_response("evaluation", evaluation_timeout)
+                    )
+                    return
+                raw_response += content
+                yield helper_functions.format_sse_event("token", {"content": content})
+        finally:
+            await tokens.aclose()
+            timings["evaluation"] = round(time.perf_counter() - evaluation_start_time, 3)
+
+        result = build_analysis_result(
+            parse_analysis_response(raw_response),
+            call_id,
+            salesforce_user_id,
+            analysis["conversation_summary"],
+            analysis["conversation_metrics"],
+        )
+        if not analysis["omissions"]:
+            cache_service.save_analysis_result(analysis["result_key"], result)
+        timings["total"] = round(time.perf_counter() - start_time, 3)
+        yield helper_functions.format_sse_event(
+            "result",
+            {**result, "timings": timings, "omissions": analysis["omissions"], "partial": bool(analysis["omissions"])},
+        )
+    except Exception as e:
+        logger.error(f"Error in streaming candidate analysis: {e}")
+        yield helper_functions.format_sse_event(
+            "error",
+            {"response": f"An error occurred while analyzing the candidate.{e}", "status_code": 500},
+        )
+    finally:
+        # The client may disconnect before the stages finish
+        if not preparation.done():
+            preparation.cancel()
+
+
 async def test_gpt(user_id):
     """Test the GPT API by sending a sample prompt."""
     try:
         logger.info(f"Testing GPT API by {user_id}")
-        response = helper_functions.test_gpt()
+        response = await helper_functions.test_gpt()
         return {"response": response, "status_code": 200}
     except Exception as e:
         logger.error(f"Error in testing GPT API: {e}")
@@ -89,3 +903,15 @@ async def test_gpt(user_id):
             "response": f"An error occurred while testing the GPT API: {e}",
             "status_code": 500,
         }
+
+
+async def get_llm_metrics():
+    """Get the recorded LLM calls per pipeline stage and model tier, the gateway counters and the hedged requests."""
+    return {
+        "response": {
+            "models": model_router.get_model_metrics(),
+            "gateway": llm_gateway.get_gateway_metrics(),
+            "hedging": model_router.get_hedge_metrics(),
+        },
+        "status_code": 200,
+    }
@@ -1,20 +1,38 @@
 from utils.thirdparty import gong_api_service
+from utils import gong_gateway, helper_functions
 from logging_module import logger
 from models.gong import CallDetailModel
 from config.db_connection import db
 from config import constants
+from datetime import datetime, timedelta, timezone
+from pydantic import ValidationError
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import DuplicateKeyError
+from uuid import uuid4
+import asyncio
+import math
+import time
+
+GONG_CALLS_SYNC_ID = "calls"
+GONG_BACKFILL_SYNC_PREFIX = "backfill"
+
+
+def get_gong_error_response(message, gong_response):
+    """Service response of a failed Gong request, keeping its status_code so a rate limited request stays a 429."""
+    response = {"response": f"{message}{gong_response.get('error')}", "status_code": gong_response["status_code"]}
+    if "retry_after_seconds" in gong_response:
+        response["retry_after_seconds"] = gong_response["retry_after_seconds"]
+    return response
+
 
 async def get_gong_users():
     """Get users from Gong."""
     try:
         users = await gong_api_service.get_users()
-        if users:
-            return {"response": users, "status_code": 200}
+        if users["status_code"] == 200:
+            return {"response": users["response"], "status_code": 200}
         else:
-            return {
-                "response": f"An error occurred while fetching users from Gong.{users}",
-                "status_code": 500,
-            }
+            return get_gong_error_response("An error occurred while fetching users from Gong.", users)
 
     except Exception as e:
         logger.error(f"Error while fetching gong users: {e}")
@@ -30,13 +48,10 @@ async def get_calls_by_date_range(start_date, end_date):
         calls = await gong_api_service.get_calls_by_date_range(
             start_date=start_date, end_date=end_date
         )
-        if calls:
-            return {"response": calls, "status_code": 200}
+        if calls["status_code"] == 200:
+            return {"response": calls["response"], "status_code": 200}
         else:
-            return {
-                "response": f"An error occurred while fetching calls from Gong.{calls}",
-                "status_code": 500,
-            }
+            return get_gong_error_response("An error occurred while fetching calls from Gong.", calls)
 
     except Exception as e:
         logger.error(f"Error while fetching gong calls: {e}")
@@ -50,13 +65,10 @@ async def get_call_transcript_by_call_id(call_id):
     """Get call transcript by call id from Gong."""
     try:
         transcript = await gong_api_service.get_call_transcript_by_call_id(call_id)
-        if transcript:
+        if transcript["status_code"] == 200:
             return {"response": transcript, "status_code": 200}
         else:
-            return {
-                "response": f"An error occurred while fetching transcript from Gong.{transcript}",
-                "status_code": 500,
-            }
+            return get_gong_error_response("An error occurred while fetching transcript from Gong.", transcript)
     except Exception as e:
         logger.error(f"Error while fetching gong transcript: {e}")
         return {
@@ -64,44 +76,421 @@ async def get_call_transcript_by_call_id(call_id):
             "status_code": 500,
         }
 
-async def gong_data_loader():
-    """Load data from Gong."""
+
+async def ensure_gong_sync_indexes():
+    """Create the unique indexes Gong calls, sync checkpoints and daily quota counters are upserted by."""
+    try:
+        await db[constants.CALL_DETAILS_COLLECTION].create_index("gong_id", unique=True)
+        await db[constants.GONG_SYNC_STATE_COLLECTION].create_index("sync_id", unique=True)
+        await db[constants.GONG_DAILY_QUOTA_COLLECTION].create_index("day", unique=True)
+    except Exception as e:
+        logger.error(f"Error while creating Gong sync indexes: {e}")
+
+
+async def get_gong_sync_state(sync_id):
+    """Get the checkpoint of a Gong sync, only its sync_id when it never ran."""
+    state = await db[constants.GONG_SYNC_STATE_COLLECTION].find_one(
+        {"sync_id": sync_id}, {constants.MONGO_INDEX_FIELD: 0}
+    )
+    return state or {"sync_id": sync_id}
+
+
+async def claim_gong_sync(sync_id, lease_owner, claimable=None, fields=None):
+    """Atomically take the lease of a Gong sync checkpoint, so that one run at a time, on any worker, owns it.
+
+    :param claimable: Extra conditions the checkpoint must meet to be claimed.
+    :param fields: Fields set along with the lease.
+    :return: The claimed checkpoint, None while another run holds an unexpired lease or claimable is not met.
+    """
+    now = datetime.now(timezone.utc)
+    try:
+        return await db[constants.GONG_SYNC_STATE_COLLECTION].find_one_and_update(
+            {
+                "sync_id": sync_id,
+                "$or": [{"lease_expires_at": None}, {"lease_expires_at": {"$lt": now}}],
+                **(claimable or {}),
+            },
+            {
+                "$set": {
+                    **(fields or {}),
+                    "lease_owner": lease_owner,
+                    "lease_expires_at": now + timedelta(seconds=constants.GONG_SYNC_LEASE_SECONDS),
+                    constants.UPDATED_AT_FIELD: now,
+                }
+            },
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+    except DuplicateKeyError:
+        # The checkpoint exists but did not match, the upsert tried to create it again
+        return None
+
+
+async def save_gong_sync_state(sync_id, lease_owner, fields):
+    """Update a Gong sync checkpoint only while lease_owner holds its lease, return whether it still does."""
+    result = await db[constants.GONG_SYNC_STATE_COLLECTION].update_one(
+        {"sync_id": sync_id, "lease_owner": lease_owner},
+        {"$set": {**fields, constants.UPDATED_AT_FIELD: datetime.now(timezone.utc)}},
+    )
+    return result.matched_count == 1
+
+
+async def renew_gong_sync_lease(sync_id, lease_owner):
+    """Keep extending the lease of a Gong sync for as long as it runs."""
+    while True:
+        await asyncio.sleep(constants.GONG_SYNC_LEASE_SECONDS / 3)
+        await save_gong_sync_state(
+            sync_id,
+            lease_owner,
+            {"lease_expires_at": datetime.now(timezone.utc) + timedelta(seconds=constants.GONG_SYNC_LEASE_SECONDS)},
+        )
+
+
+async def release_gong_sync(sync_id, lease_owner, lease_renewal, fields=None):
+    """Stop renewing the lease of a Gong sync and hand it back, along with the final fields."""
+    lease_renewal.cancel()
+    await save_gong_sync_state(sync_id, lease_owner, {**(fields or {}), "lease_owner": None, "lease_expires_at": None})
+
+
+async def fetch_gong_call_pages(pages, from_date_time=None, to_date_time=None, cursor=None):
+    """Put every page of Gong calls started within a date range on the pages queue, with the cursor of the next page.
+
+    None marks the last page, a response with an error status_code a failed fetch.
+    """
     try:
-        gong_data = await gong_api_service.get_gong_extensive_call_data()
-        cursor = ""
-        if gong_data["status_code"] == 200:
-            cursor = gong_data["response"]["records"]["cursor"]
-            await save_gong_record_in_db(gong_data["response"]["calls"])
+        while True:
+            gong_data = await gong_api_service.get_gong_extensive_call_data(cursor, from_date_time, to_date_time)
+            # Gong answers 404 when no call matches the filter
+            if gong_data.get("status") == 404:
+                break
+            if gong_data["status_code"] != 200:
+                await pages.put(get_gong_error_response("An error occurred while fetching calls from Gong.", gong_data))
+                return
+            cursor = gong_data["response"].get("records", {}).get("cursor")
+            await pages.put({"calls": gong_data["response"].get("calls", []), "cursor": cursor, "status_code": 200})
+            if not cursor:
+                break
+        await pages.put(None)
+    except Exception as e:
+        logger.error(f"Error while fetching calls from Gong: {e}")
+        await pages.put({"response": f"An error occurred while fetching calls from Gong.{e}", "status_code": 500})
 
+
+async def sync_gong_call_pages(sync_id, lease_owner, from_date_time=None, to_date_time=None, cursor=None):
+    """Fetch and store the Gong calls started within a date range, page by page.
+
+    The next page is fetched while the previous one is stored, at most GONG_SYNC_QUEUE_PAGES
+    pages wait in between. The cursor of the next page is checkpointed once a page is stored,
+    so an interrupted sync resumes from there. A page stored again after a crash is upserted, not duplicated.
+    The sync stops when lease_owner lost the lease of the checkpoint to another run.
+    """
+    pages = asyncio.Queue(maxsize=constants.GONG_SYNC_QUEUE_PAGES)
+    fetcher = asyncio.create_task(fetch_gong_call_pages(pages, from_date_time, to_date_time, cursor))
+    page_count = 0
+    calls = 0
+    fetch_wait_seconds = 0.0
+    write_seconds = 0.0
+    try:
         while True:
-            gong_data = await gong_api_service.get_gong_extensive_call_data(cursor)
-            await save_gong_record_in_db(gong_data["response"]["calls"])
-            if "cursor" not in gong_data["response"]["records"]:
+            start_time = time.perf_counter()
+            page = await pages.get()
+            fetch_wait_seconds += time.perf_counter() - start_time
+            if page is None:
                 break
-            cursor = gong_data["response"]["records"]["cursor"]
+            if page["status_code"] != 200:
+                return page
+            start_time = time.perf_counter()
+            saved = await save_gong_record_in_db(page["calls"])
+            if saved["status_code"] != 200:
+                return saved
+            if page["cursor"] and not await save_gong_sync_state(sync_id, lease_owner, {"cursor": page["cursor"]}):
+                return {"response": "Another run took over this Gong sync.", "status_code": 409}
+            write_seconds += time.perf_counter() - start_time
+            page_count += 1
+            calls += saved["saved"]
+        return {
+            "pages": page_count,
+            "calls": calls,
+            "timings": {"fetch_wait": round(fetch_wait_seconds, 3), "write": round(write_seconds, 3)},
+            "status_code": 200,
+        }
+    finally:
+        # Stops fetching when storing failed, a finished fetcher is left as is
+        fetcher.cancel()
+
+
+def get_gong_sync_start(watermark):
+    """fromDateTime of the next sync, GONG_SYNC_OVERLAP_HOURS before the watermark."""
+    if not watermark:
+        return constants.GONG_SYNC_START_DATE
+    return (datetime.fromisoformat(watermark) - timedelta(hours=constants.GONG_SYNC_OVERLAP_HOURS)).isoformat()
+
 
-        return {"response": "Loaded", "status_code": 200}
+async def gong_data_loader():
+    """Load the Gong calls started since the last sync.
+
+    A run covers fromDateTime to the time it started, and moves the watermark there once
+    its last page is stored. A run that failed or crashed is resumed from its checkpoint.
+    The run holds a lease on the checkpoint, on every worker a second run gets a 409.
+    Its Gong requests queue behind interactive ones.
+    """
+    lease_owner = uuid4().hex
+    state = await claim_gong_sync(GONG_CALLS_SYNC_ID, lease_owner)
+    if state is None:
+        return {"response": "A Gong sync is already running.", "status_code": 409}
+    lease_renewal = asyncio.create_task(renew_gong_sync_lease(GONG_CALLS_SYNC_ID, lease_owner))
+    final_fields = {}
+    priority_token = gong_gateway.gong_priority.set(gong_gateway.PRIORITY_BACKGROUND)
+    try:
+        resumed = state.get("run_to") is not None
+        if resumed:
+            from_date_time, to_date_time, cursor = state.get("run_from"), state["run_to"], state.get("cursor")
+            logger.info(f"Resuming the Gong sync of {from_date_time} to {to_date_time}")
+        else:
+            from_date_time = get_gong_sync_start(state.get("watermark"))
+            to_date_time = datetime.now(timezone.utc).replace(microsecond=0).isoformat()
+            cursor = None
+            await save_gong_sync_state(
+                GONG_CALLS_SYNC_ID,
+                lease_owner,
+                {"run_from": from_date_time, "run_to": to_date_time, "cursor": None},
+            )
+
+        synced = await sync_gong_call_pages(GONG_CALLS_SYNC_ID, lease_owner, from_date_time, to_date_time, cursor)
+        if synced["status_code"] != 200:
+            return synced
+        final_fields = {"watermark": to_date_time, "run_from": None, "run_to": None, "cursor": None}
+        return {
+            "response": {
+                "from_date_time": from_date_time,
+                "watermark": to_date_time,
+                "resumed": resumed,
+                "pages": synced["pages"],
+                "calls": synced["calls"],
+                "timings": synced["timings"],
+            },
+            "status_code": 200,
+        }
     except Exception as e:
         logger.error(f"Error while loading data from Gong: {e}")
         return {
             "response": f"An error occurred while loading data from Gong.{e}",
             "status_code": 500,
         }
-    
+    finally:
+        gong_gateway.gong_priority.reset(priority_token)
+        await release_gong_sync(GONG_CALLS_SYNC_ID, lease_owner, lease_renewal, final_fields)
+
+
+def parse_gong_date_time(value):
+    """Parse an ISO date or datetime, naive values are taken as UTC."""
+    date_time = datetime.fromisoformat(value)
+    if date_time.tzinfo is None:
+        date_time = date_time.replace(tzinfo=timezone.utc)
+    return date_time
+
+
+def split_date_windows(from_date_time, to_date_time, window_days):
+    """Split a date range into consecutive windows of window_days, as (fromDateTime, toDateTime) ISO strings."""
+    windows = []
+    window_start = from_date_time
+    while window_start < to_date_time:
+        window_end = min(window_start + timedelta(days=window_days), to_date_time)
+        windows.append((window_start.isoformat(), window_end.isoformat()))
+        window_start = window_end
+    return windows
+
+
+def get_backfill_window_sync_id(window_from, window_to):
+    return f"{GONG_BACKFILL_SYNC_PREFIX}:{window_from}:{window_to}"
+
+
+async def sync_gong_backfill_window(sync_id, window_from, window_to):
+    """Sync the calls of one backfill window, resuming from its checkpoint. A completed window is skipped.
+
+    The window is claimed in its checkpoint, while one run holds it other runs on any worker get a 409.
+    """
+    window = {"sync_id": sync_id, "window_from": window_from, "window_to": window_to}
+    lease_owner = uuid4().hex
+    state = await claim_gong_sync(
+        sync_id,
+        lease_owner,
+        claimable={"status": {"$ne": "completed"}},
+        fields={**window, "backfill": True, "status": "running", "error": None},
+    )
+    if state is None:
+        if (await get_gong_sync_state(sync_id)).get("status") == "completed":
+            return {**window, "status": "completed", "skipped": True, "status_code": 200}
+        return {**window, "status": "running", "status_code": 409}
+    lease_renewal = asyncio.create_task(renew_gong_sync_lease(sync_id, lease_owner))
+    final_fields = {}
+    try:
+        synced = await sync_gong_call_pages(sync_id, lease_owner, window_from, window_to, state.get("cursor"))
+        if synced["status_code"] != 200:
+            final_fields = {"status": "failed", "error": synced["response"]}
+            return {**window, "status": "failed", "error": synced["response"], "status_code": synced["status_code"]}
+        final_fields = {"status": "completed", "cursor": None, "pages": synced["pages"], "calls": synced["calls"]}
+        return {**window, "status": "completed", "pages": synced["pages"], "calls": synced["calls"], "status_code": 200}
+    except Exception as e:
+        logger.error(f"Error while backfilling Gong calls of {window_from} to {window_to}: {e}")
+        final_fields = {"status": "failed", "error": str(e)}
+        return {**window, "status": "failed", "error": str(e), "status_code": 500}
+    finally:
+        await release_gong_sync(sync_id, lease_owner, lease_renewal, final_fields)
+
+
+async def advance_gong_sync_watermark(to_date_time):
+    """Let the incremental sync start where a completed backfill ended, unless it already got further.
+
+    The watermark is only moved while no incremental run is in progress and still holds the value
+    compared against, a run that starts or finishes in between wins.
+    """
+    state = await get_gong_sync_state(GONG_CALLS_SYNC_ID)
+    watermark = state.get("watermark")
+    if watermark and parse_gong_date_time(watermark) >= parse_gong_date_time(to_date_time):
+        return
+    try:
+        await db[constants.GONG_SYNC_STATE_COLLECTION].update_one(
+            {
+                "sync_id": GONG_CALLS_SYNC_ID,
+                "watermark": watermark,
+                "run_to": None,
+                "$or": [{"lease_expires_at": None}, {"lease_expires_at": {"$lt": datetime.now(timezone.utc)}}],
+            },
+            {"$set": {"watermark": to_date_time, constants.UPDATED_AT_FIELD: datetime.now(timezone.utc)}},
+            upsert=True,
+        )
+    except DuplicateKeyError:
+        # An incremental run holds the checkpoint or moved the watermark meanwhile
+        pass
+
+
+async def gong_backfill(from_date, to_date=None, window_days=None):
+    """Load the Gong calls of a date range, split into windows fetched concurrently.
+
+    Every window has its own checkpoint, running the same range again skips the completed
+    windows and resumes the others. Windows share the Gong request scheduler at background
+    priority, so the backfill stays within the rate limits and behind interactive requests.
+    """
+    try:
+        window_days = window_days or constants.GONG_BACKFILL_WINDOW_DAYS
+        from_date_time = parse_gong_date_time(from_date)
+        to_date_time = parse_gong_date_time(to_date) if to_date else datetime.now(timezone.utc).replace(microsecond=0)
+        if from_date_time >= to_date_time:
+            return {"response": "from_date must be before to_date.", "status_code": 400}
+        # Checked before the windows are built, a tiny window_days over a long range would make millions of them
+        window_count = math.ceil((to_date_time - from_date_time) / timedelta(days=window_days))
+        if window_count > constants.GONG_BACKFILL_MAX_WINDOWS:
+            return {
+                "response": f"A backfill can span at most {constants.GONG_BACKFILL_MAX_WINDOWS} windows.",
+                "status_code": 400,
+            }
+        windows = split_date_windows(from_date_time, to_date_time, window_days)
+        semaphore = asyncio.Semaphore(constants.GONG_BACKFILL_CONCURRENCY)
+
+        async def backfill_window(window_from, window_to):
+            async with semaphore:
+                return await sync_gong_backfill_window(
+                    get_backfill_window_sync_id(window_from, window_to), window_from, window_to
+                )
+
+        priority_token = gong_gateway.gong_priority.set(gong_gateway.PRIORITY_BACKGROUND)
+        try:
+            results = await asyncio.gather(*(backfill_window(*window) for window in windows))
+        finally:
+            gong_gateway.gong_priority.reset(priority_token)
+        failed = [result["sync_id"] for result in results if result["status"] != "completed"]
+        if not failed:
+            await advance_gong_sync_watermark(to_date_time.isoformat())
+        return {
+            "response": {
+                "windows": results,
+                "completed": len(results) - len(failed),
+                "failed": failed,
+                "calls": sum(result.get("calls", 0) for result in results),
+            },
+            "status_code": 200,
+        }
+    except ValueError as e:
+        return {"response": f"Invalid backfill dates.{e}", "status_code": 400}
+    except Exception as e:
+        logger.error(f"Error while backfilling data from Gong: {e}")
+        return {
+            "response": f"An error occurred while backfilling data from Gong.{e}",
+            "status_code": 500,
+        }
+
+
+async def retry_gong_backfill_window(sync_id):
+    """Run a single backfill window again, from its checkpoint."""
+    try:
+        state = await get_gong_sync_state(sync_id)
+        if not state.get("backfill"):
+            return {"response": "Backfill window not found.", "status_code": 404}
+        priority_token = gong_gateway.gong_priority.set(gong_gateway.PRIORITY_BACKGROUND)
+        try:
+            result = await sync_gong_backfill_window(sync_id, state["window_from"], state["window_to"])
+        finally:
+            gong_gateway.gong_priority.reset(priority_token)
+        return {"response": result, "status_code": result["status_code"]}
+    except Exception as e:
+        logger.error(f"Error while retrying the Gong backfill window {sync_id}: {e}")
+        return {
+            "response": f"An error occurred while retrying the Gong backfill window.{e}",
+            "status_code": 500,
+        }
+
+
+async def get_gong_backfill_windows():
+    """Get the checkpoint and status of every backfill window."""
+    try:
+        windows = await db[constants.GONG_SYNC_STATE_COLLECTION].find(
+            {"backfill": True}, {constants.MONGO_INDEX_FIELD: 0}
+        ).sort("window_from", 1).to_list(length=None)
+        # A running window also holds its lease expiry, every datetime field is serialized
+        windows = [helper_functions.convert_object_datetime_keys_to_str(window) for window in windows]
+        return {"response": windows, "status_code": 200}
+    except Exception as e:
+        logger.error(f"Error while fetching Gong backfill windows: {e}")
+        return {
+            "response": f"An error occurred while fetching Gong backfill windows.{e}",
+            "status_code": 500,
+        }
+
+
 async def save_gong_record_in_db(records):
-    """Save Gong records in database."""
+    """Upsert Gong call records by gong_id, skipping the records that do not validate."""
     try:
-        call_details_collection = db[constants.CALL_DETAILS_COLLECTION]
-        all_records = [CallDetailModel(**record["metaData"]) for record in records]
-        call_details_collection.insert_many([record.model_dump() for record in all_records])
-        return {"response": "Records saved successfully", "status_code": 200}
+        call_details = []
+        skipped = 0
+        for record in records:
+            try:
+                call_details.append(CallDetailModel(**record["metaData"]).model_dump())
+            except (KeyError, ValidationError) as e:
+                skipped += 1
+                logger.warning(f"Skipping an invalid Gong call record: {e}")
+        if call_details:
+            await db[constants.CALL_DETAILS_COLLECTION].bulk_write(
+                [
+                    UpdateOne({"gong_id": call_detail["gong_id"]}, {"$set": call_detail}, upsert=True)
+                    for call_detail in call_details
+                ],
+                ordered=False,
+            )
+        return {
+            "response": "Records saved successfully",
+            "saved": len(call_details),
+            "skipped": skipped,
+            "status_code": 200,
+        }
     except Exception as e:
         logger.error(f"Error while saving records in database: {e}")
         return {
             "response": f"An error occurred while saving records in database.{e}",
             "status_code": 500,
         }
-    
+
+
 async def get_matching_records_with_title(title):
     """Get matching records with title from database."""
     try:
@@ -116,4 +505,61 @@ async def get_matching_records_with_title(title):
         return {
             "response": f"An error occurred while fetching records from database.{e}",
             "status_code": 500,
-        }
\ No newline at end of file
+        }
+
+
+async def ensure_conversation_metrics_indexes():
+    """Create the index conversation metrics are looked up by."""
+    try:
+        await db[constants.CONVERSATION_METRICS_COLLECTION].create_index("call_id", unique=True)
+    except Exception as e:
+        logger.error(f"Error while creating conversation metrics indexes: {e}")
+
+
+async def save_conversation_metrics(metrics_by_call):
+    """Store the conversation metrics of each call, replacing the previous ones."""
+    try:
+        if not metrics_by_call:
+            return {"response": "No conversation metrics to save", "status_code": 200}
+        now = datetime.now(timezone.utc)
+        await db[constants.CONVERSATION_METRICS_COLLECTION].bulk_write(
+            [
+                UpdateOne(
+                    {"call_id": call_id},
+                    {"$set": {**metrics, "call_id": call_id, constants.UPDATED_AT_FIELD: now}},
+                    upsert=True,
+                )
+                for call_id, metrics in metrics_by_call.items()
+            ],
+            ordered=False,
+        )
+        return {"response": "Conversation metrics saved successfully", "status_code": 200}
+    except Exception as e:
+        logger.error(f"Error while saving conversation metrics: {e}")
+        return {
+            "response": f"An error occurred while saving conversation metrics.{e}",
+            "status_code": 500,
+        }
+
+
+async def get_conversation_metrics(call_id):
+    """Get the stored conversation metrics of a call."""
+    try:
+        metrics = await db[constants.CONVERSATION_METRICS_COLLECTION].find_one(
+            {"call_id": call_id}, {constants.MONGO_INDEX_FIELD: 0}
+        )
+        if not metrics:
+            return {"response": "Conversation metrics not found.", "status_code": 404}
+        metrics[constants.UPDATED_AT_FIELD] = metrics[constants.UPDATED_AT_FIELD].isoformat()
+        return {"response": metrics, "status_code": 200}
+    except Exception as e:
+        logger.error(f"Error while fetching conversation metrics: {e}")
+        return {
+            "response": f"An error occurred while fetching conversation metrics.{e}",
+            "status_code": 500,
+        }
+
+
+async def get_gong_request_metrics():
+    """Get the request, rate limit and daily quota counters of the Gong scheduler."""
+    return {"response": await gong_gateway.get_gateway_metrics(), "status_code": 200}
@@ -1,5 +1,8 @@
 from utils.thirdparty.salesforce_api_service import SalesforceApiService
 from logging_module import logger
+from services import cache_service
+from utils import document_utils
+import asyncio
 
 
 async def get_salesforce_data(query):
@@ -69,6 +72,18 @@ async def get_salesforce_contacts():
         }
 
 
+async def cache_uploaded_resume_text(salesforce_instance, content_document_id, file_contents):
+    """Extract the text of a freshly uploaded resume and store it in the resume text cache."""
+    try:
+        content_version = await asyncio.to_thread(
+            salesforce_instance.get_latest_content_version, content_document_id
+        )
+        resume = await asyncio.to_thread(document_utils.extract_resume, file_contents)
+        await cache_service.save_resume_text(content_document_id, content_version["Id"], resume)
+    except Exception as e:
+        logger.error(f"Error while caching the uploaded resume text: {e}")
+
+
 async def upload_resume_to_a_user(record_id, file):
     """Upload a file to Salesforce and link it to a record."""
     try:
@@ -80,6 +95,8 @@ async def upload_resume_to_a_user(record_id, file):
         content_document_id = salesforce_instance.upload_file_to_salesforce(
             file_name=file_name, file_content=file_contents, linked_entity_id=record_id
         )
+        if content_document_id and file_name.lower().endswith(".pdf"):
+            await cache_uploaded_resume_text(salesforce_instance, content_document_id, file_contents)
         return {
             "message": "File uploaded successfully",
             "content_document_id": content_document_id,
@@ -123,8 +140,11 @@ async def download_file_from_salesforce(content_document_id):
 async def get_salesforce_user_first_document(salesforce_user_id):
     """Get the first document linked to a user in Salesforce."""
     try:
-        salesforce_instance = SalesforceApiService()
-        document = salesforce_instance.get_salesforce_user_first_document(salesforce_user_id)
+        # simple_salesforce is blocking, run it off the event loop so other stages can progress
+        salesforce_instance = await asyncio.to_thread(SalesforceApiService)
+        document = await asyncio.to_thread(
+            salesforce_instance.get_salesforce_user_first_document, salesforce_user_id
+        )
         if document["status_code"] == 500:
             return document
         return {"response": document, "status_code": 200}
@@ -135,6 +155,42 @@ async def get_salesforce_user_first_document(salesforce_user_id):
             "status_code": 500,
         }
 
+async def get_salesforce_instance():
+    """Log in to Salesforce off the event loop, the login is a blocking SOAP round trip."""
+    return await asyncio.to_thread(SalesforceApiService)
+
+async def get_salesforce_user_first_document_version(salesforce_user_id, salesforce_instance=None):
+    """Get the ContentDocumentId and latest ContentVersion Id of the first document linked to a user in Salesforce.
+
+    Pass the salesforce_instance of a previous call to reuse its login.
+    """
+    try:
+        salesforce_instance = salesforce_instance or await get_salesforce_instance()
+        return await asyncio.to_thread(
+            salesforce_instance.get_salesforce_user_first_document_version, salesforce_user_id
+        )
+    except Exception as e:
+        logger.error(f"Error while fetching the first document version linked to the user: {e}")
+        return {
+            "response": f"An error occurred while fetching the first document version linked to the user: {e}",
+            "status_code": 500,
+        }
+
+async def download_salesforce_content_version(version_data_url, salesforce_instance=None):
+    """Download the binary content of a ContentVersion from Salesforce.
+
+    Pass the salesforce_instance of a previous call to reuse its login.
+    """
+    try:
+        salesforce_instance = salesforce_instance or await get_salesforce_instance()
+        return await asyncio.to_thread(salesforce_instance.download_version_data, version_data_url)
+    except Exception as e:
+        logger.error(f"Error while downloading the content version from Salesforce: {e}")
+        return {
+            "response": f"An error occurred while downloading the content version from Salesforce: {e}",
+            "status_code": 500,
+        }
+
 async def attach_note_to_salesforce_user(note_title, note_body, linked_entity_id):
     """Attach a note to a resume in Salesforce."""
     try:
@@ -152,8 +208,10 @@ async def attach_note_to_salesforce_user(note_title, note_body, linked_entity_id
 async def get_salesforce_user_notes(linked_entity_id):
     """Get notes attached to a specific record in Salesforce."""
     try:
-        salesforce_instance = SalesforceApiService()
-        notes = salesforce_instance.get_salesforce_user_notes(linked_entity_id)
+        salesforce_instance = await asyncio.to_thread(SalesforceApiService)
+        notes = await asyncio.to_thread(
+            salesforce_instance.get_salesforce_user_notes, linked_entity_id
+        )
         if notes["status_code"] == 500:
             return notes
         return {"response": notes["notes"], "status_code": 200}
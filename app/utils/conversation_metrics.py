@@ -0,0 +1,152 @@
+from utils.transcript_utils import UNKNOWN_SPEAKER_ID
+import numpy as np
+
+MILLISECONDS_PER_SECOND = 1000
+
+
+def build_sentence_arrays(call_transcripts):
+    """Flatten the sentences of Gong call transcripts into parallel arrays, ordered by call and start time.
+
+    Speakers are numbered across all calls, the same speakerId in two calls counts as two speakers.
+    """
+    call_indexes = []
+    speaker_indexes = []
+    starts = []
+    ends = []
+    questions = []
+    speakers = []
+    speaker_numbers = {}
+    for call_index, call_transcript in enumerate(call_transcripts):
+        for section in call_transcript.get("transcript", []):
+            speaker_key = (call_index, section.get("speakerId", UNKNOWN_SPEAKER_ID))
+            if speaker_key not in speaker_numbers:
+                speaker_numbers[speaker_key] = len(speakers)
+                speakers.append(speaker_key)
+            for sentence in section.get("sentences", []):
+                call_indexes.append(call_index)
+                speaker_indexes.append(speaker_numbers[speaker_key])
+                starts.append(sentence.get("start", 0))
+                ends.append(sentence.get("end", sentence.get("start", 0)))
+                questions.append(sentence.get("text", "").rstrip().endswith("?"))
+
+    call_indexes = np.array(call_indexes, dtype=np.int64)
+    starts = np.array(starts, dtype=np.float64) / MILLISECONDS_PER_SECOND
+    order = np.lexsort((starts, call_indexes))
+    return {
+        "call": call_indexes[order],
+        "speaker": np.array(speaker_indexes, dtype=np.int64)[order],
+        "start": starts[order],
+        "end": np.array(ends, dtype=np.float64)[order] / MILLISECONDS_PER_SECOND,
+        "question": np.array(questions, dtype=bool)[order],
+        "speakers": speakers,
+    }
+
+
+def compute_conversation_metrics_batch(call_transcripts, speaker_labels=None):
+    """Compute per-speaker conversation metrics of many Gong calls at once.
+
+    A turn is a run of consecutive sentences of one speaker. A turn starting before the previous
+    turn ended interrupts it, otherwise the gap between them is the response latency.
+
+    :param call_transcripts: Gong call transcripts, with timed sentences.
+    :param speaker_labels: Speaker labels of each call by call id, see transcript_utils.get_speaker_labels.
+    :return: Metrics of each call by call id, with one entry per speaker.
+    """
+    speaker_labels = speaker_labels or {}
+    arrays = build_sentence_arrays(call_transcripts)
+    call, speaker, start, end = arrays["call"], arrays["speaker"], arrays["start"], arrays["end"]
+    call_count = len(call_transcripts)
+    speaker_count = len(arrays["speakers"])
+    if not len(call):
+        return {call_transcript["callId"]: {"duration_seconds": 0.0, "speakers": []} for call_transcript in call_transcripts}
+
+    speaker_call = np.array([call_index for call_index, _ in arrays["speakers"]], dtype=np.int64)
+    durations = np.clip(end - start, 0, None)
+    talk_seconds = np.bincount(speaker, weights=durations, minlength=speaker_count)
+    call_talk_seconds = np.bincount(call, weights=durations, minlength=call_count)
+    call_start = np.full(call_count, np.inf)
+    call_end = np.zeros(call_count)
+    np.minimum.at(call_start, call, start)
+    np.maximum.at(call_end, call, end)
+    call_duration = np.where(np.isfinite(call_start), call_end - call_start, 0)
+
+    turn_starts = np.ones(len(call), dtype=bool)
+    turn_starts[1:] = (speaker[1:] != speaker[:-1]) | (call[1:] != call[:-1])
+    turn_indexes = np.flatnonzero(turn_starts)
+    turn_speaker = speaker[turn_indexes]
+    turn_call = call[turn_indexes]
+    turn_start = np.minimum.reduceat(start, turn_indexes)
+    turn_end = np.maximum.reduceat(end, turn_indexes)
+
+    longest_monologue = np.zeros(speaker_count)
+    np.maximum.at(longest_monologue, turn_speaker, turn_end - turn_start)
+
+    # Every turn after the first of its call either interrupts the previous one or responds to it
+    follows = np.zeros(len(turn_indexes), dtype=bool)
+    follows[1:] = turn_call[1:] == turn_call[:-1]
+    gaps = np.zeros(len(turn_indexes))
+    gaps[1:] = turn_start[1:] - turn_end[:-1]
+    interrupting = follows & (gaps < 0)
+    responding = follows & (gaps >= 0)
+    interruptions = np.bincount(turn_speaker[interrupting], minlength=speaker_count)
+    responses = np.bincount(turn_speaker[responding], minlength=speaker_count)
+    response_latency = np.bincount(turn_speaker[responding], weights=gaps[responding], minlength=speaker_count)
+    questions = np.bincount(speaker[arrays["question"]], minlength=speaker_count)
+
+    speaker_call_duration_minutes = call_duration[speaker_call] / 60
+    talk_ratio = np.divide(
+        talk_seconds, call_talk_seconds[speaker_call], out=np.zeros(speaker_count), where=call_talk_seconds[speaker_call] > 0
+    )
+    questions_per_minute = np.divide(
+        questions, speaker_call_duration_minutes, out=np.zeros(speaker_count), where=speaker_call_duration_minutes > 0
+    )
+    average_response_latency = np.divide(
+        response_latency, responses, out=np.full(speaker_count, np.nan), where=responses > 0
+    )
+
+    metrics_by_call = {
+        call_transcript["callId"]: {"duration_seconds": round(float(call_duration[call_index]), 1), "speakers": []}
+        for call_index, call_transcript in enumerate(call_transcripts)
+    }
+    for speaker_index, (call_index, speaker_id) in enumerate(arrays["speakers"]):
+        call_id = call_transcripts[call_index]["callId"]
+        metrics_by_call[call_id]["speakers"].append(
+            {
+                "speaker_id": speaker_id,
+                "speaker": speaker_labels.get(call_id, {}).get(speaker_id, speaker_id),
+                "talk_ratio": round(float(talk_ratio[speaker_index]), 3),
+                "talk_seconds": round(float(talk_seconds[speaker_index]), 1),
+                "longest_monologue_seconds": round(float(longest_monologue[speaker_index]), 1),
+                "interruptions": int(interruptions[speaker_index]),
+                "questions": int(questions[speaker_index]),
+                "questions_per_minute": round(float(questions_per_minute[speaker_index]), 2),
+                "average_response_latency_seconds": (
+                    None if np.isnan(average_response_latency[speaker_index])
+                    else round(float(average_response_latency[speaker_index]), 2)
+                ),
+            }
+        )
+    return metrics_by_call
+
+
+def compute_conversation_metrics(call_transcript, speaker_labels=None):
+    """Compute the per-speaker conversation metrics of a single Gong call."""
+    call_id = call_transcript["callId"]
+    return compute_conversation_metrics_batch([call_transcript], {call_id: speaker_labels or {}})[call_id]
+
+
+def format_conversation_metrics(metrics_by_call):
+    """Render conversation metrics as one compact line per speaker, for the GPT prompt."""
+    lines = []
+    for call_id, metrics in metrics_by_call.items():
+        lines.append(f"Call {call_id} ({metrics['duration_seconds'] / 60:.1f} min):")
+        for speaker in metrics["speakers"]:
+            line = (
+                f"- {speaker['speaker']}: talks {speaker['talk_ratio']:.0%} of the time, "
+                f"longest monologue {speaker['longest_monologue_seconds']:.0f}s, "
+                f"{speaker['interruptions']} interruptions, {speaker['questions_per_minute']} questions/min"
+            )
+            if speaker["average_response_latency_seconds"] is not None:
+                line += f", responds after {speaker['average_response_latency_seconds']}s on average"
+            lines.append(line)
+    return "\n".join(lines)
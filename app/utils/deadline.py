@@ -0,0 +1,15 @@
+import time
+
+
+class Deadline:
+    """Point in time a request must finish by, shared by its pipeline stages."""
+
+    def __init__(self, seconds):
+        self.expires_at = time.monotonic() + seconds
+
+    def remaining(self):
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def stage_timeout(self, stage_seconds, reserved_seconds=0):
+        """Timeout of a stage: its own budget, cut short so reserved_seconds remain for the later stages."""
+        return max(0.0, min(stage_seconds, self.remaining() - reserved_seconds))
@@ -0,0 +1,161 @@
+from utils.token_utils import count_tokens, fit_sections_to_token_budget
+from io import BytesIO
+import html
+import pdfplumber
+import re
+
+# Bumped whenever the normalization changes, so that resume texts cached by an older version are extracted again
+DOCUMENT_NORMALIZER_VERSION = "2"
+
+PROFILE_SECTION = "profile"
+# Canonical resume sections and the headings they go by
+SECTION_HEADINGS = {
+    "summary": ("summary", "professional summary", "profile", "about me", "objective", "career objective"),
+    "experience": (
+        "experience", "work experience", "professional experience", "employment", "employment history",
+        "work history", "career history", "relevant experience",
+    ),
+    "skills": ("skills", "core competencies", "competencies", "key skills", "technical skills", "areas of expertise", "expertise"),
+    "education": ("education", "education and training", "academic background"),
+    "certifications": ("certifications", "certificates", "licenses and certifications", "training"),
+    "achievements": ("achievements", "accomplishments", "awards", "honors and awards"),
+}
+HEADING_SECTIONS = {heading: section for section, headings in SECTION_HEADINGS.items() for heading in headings}
+# Order sections are written in the structured form, most telling first
+SECTION_ORDER = ("summary", "experience", "skills", "achievements", "certifications", "education", PROFILE_SECTION)
+
+PAGE_NUMBER_PATTERN = re.compile(r"^(?:page\s*)?\d{1,3}(?:\s*(?:of|/)\s*\d{1,3})?$", re.IGNORECASE)
+HYPHENATED_LINE_BREAK_PATTERN = re.compile(r"(\w)-\n\s*([a-z])")
+BULLET_PATTERN = re.compile(r"^(?:[-*•▪◦●■]|\d+[.)])\s")
+HTML_TAG_PATTERN = re.compile(r"<[^>]+>")
+HTML_BLOCK_END_PATTERN = re.compile(r"</(?:p|div|li|h\d)>|<br\s*/?>", re.IGNORECASE)
+# Lines at most this long can be page headers or footers
+MAX_FURNITURE_LINE_CHARACTERS = 80
+# Lines at the top and at the bottom of a page that can be page headers or footers
+FURNITURE_EDGE_LINES = 3
+# Page numbers within a header or footer line, "Page 2", "2 of 5", "2/5" or a number at either end
+PAGE_NUMBER_TOKEN_PATTERN = re.compile(
+    r"\bpage\s*\d{1,3}(?:\s*(?:of|/)\s*\d{1,3})?\b|\b\d{1,3}\s*(?:of|/)\s*\d{1,3}\b|^\d{1,3}\b|\b\d{1,3}$",
+    re.IGNORECASE,
+)
+
+
+def extract_pdf_pages(file_content_bytes):
+    """Extract the text of every page of a PDF given its raw bytes, one string per page."""
+    with pdfplumber.open(BytesIO(file_content_bytes)) as pdf:
+        return [page.extract_text() or "" for page in pdf.pages]
+
+
+def get_furniture_key(line):
+    """Compare header and footer lines with their page numbers ignored, "Page 2" repeats "Page 1"."""
+    return PAGE_NUMBER_TOKEN_PATTERN.sub("#", line.strip().lower())
+
+
+def get_edge_line_indexes(lines):
+    """Indexes of the lines at the top and at the bottom of a page, where headers and footers sit."""
+    return set(range(min(FURNITURE_EDGE_LINES, len(lines)))) | set(range(max(0, len(lines) - FURNITURE_EDGE_LINES), len(lines)))
+
+
+def remove_page_furniture(pages):
+    """Drop page numbers and the header and footer lines repeated on most pages.
+
+    Only the first and last FURNITURE_EDGE_LINES lines of a page are considered, a line
+    repeated in the body of the pages is content.
+    """
+    page_lines = [[line.strip() for line in page.splitlines() if line.strip()] for page in pages]
+    repeated_keys = set()
+    if len(pages) > 1:
+        page_counts = {}
+        for lines in page_lines:
+            edge_keys = {
+                get_furniture_key(lines[index])
+                for index in get_edge_line_indexes(lines)
+                if len(lines[index]) <= MAX_FURNITURE_LINE_CHARACTERS
+            }
+            for key in edge_keys:
+                page_counts[key] = page_counts.get(key, 0) + 1
+        repeated_keys = {key for key, count in page_counts.items() if count >= max(2, len(pages) / 2)}
+    kept_page_lines = []
+    for lines in page_lines:
+        edge_indexes = get_edge_line_indexes(lines)
+        kept_page_lines.append(
+            [
+                line for index, line in enumerate(lines)
+                if index not in edge_indexes
+                or not (PAGE_NUMBER_PATTERN.match(line) or get_furniture_key(line) in repeated_keys)
+            ]
+        )
+    return kept_page_lines
+
+
+def get_section_heading(line):
+    """The canonical section a heading line opens, None when the line is not a heading."""
+    heading = re.sub(r"[^a-z& ]", "", line.lower()).replace("&", "and").strip()
+    return HEADING_SECTIONS.get(" ".join(heading.split()))
+
+
+def rejoin_lines(lines):
+    """Rejoin lines the PDF layout wrapped, keeping headings and bullets on their own lines."""
+    text = HYPHENATED_LINE_BREAK_PATTERN.sub(r"\1\2", "\n".join(lines))
+    paragraphs = []
+    for line in text.split("\n"):
+        starts_paragraph = (
+            not paragraphs
+            or get_section_heading(line)
+            or get_section_heading(paragraphs[-1])
+            or BULLET_PATTERN.match(line)
+            or paragraphs[-1].endswith((".", ":", ";", "!", "?"))
+            or not line[:1].islower()
+        )
+        if starts_paragraph:
+            paragraphs.append(line)
+        else:
+            paragraphs[-1] += f" {line}"
+    return paragraphs
+
+
+def split_sections(paragraphs):
+    """Group paragraphs under the canonical section of their heading, what precedes the first heading is the profile."""
+    sections = {}
+    section = PROFILE_SECTION
+    for paragraph in paragraphs:
+        heading_section = get_section_heading(paragraph)
+        if heading_section:
+            section = heading_section
+            continue
+        sections.setdefault(section, []).append(paragraph)
+    return {section: "\n".join(section_paragraphs) for section, section_paragraphs in sections.items()}
+
+
+def normalize_document_pages(pages):
+    """Normalize the page texts of a resume into clean text and its sections.
+
+    :return: "text", the whole normalized document, and "sections", its text by canonical section.
+    """
+    lines = [line for page in remove_page_furniture(pages) for line in page]
+    paragraphs = rejoin_lines(lines)
+    return {"text": "\n".join(paragraphs), "sections": split_sections(paragraphs)}
+
+
+def extract_resume(file_content_bytes):
+    """Extract and normalize the text of a PDF resume given its raw bytes."""
+    return normalize_document_pages(extract_pdf_pages(file_content_bytes))
+
+
+def normalize_note_text(text):
+    """Turn a Salesforce note body, plain text or HTML, into plain text with its wrapped lines rejoined."""
+    text = HTML_BLOCK_END_PATTERN.sub("\n", text or "")
+    text = html.unescape(HTML_TAG_PATTERN.sub("", text))
+    lines = [" ".join(line.split()) for line in text.splitlines()]
+    return "\n".join(rejoin_lines([line for line in lines if line]))
+
+
+def format_structured_document(sections, max_tokens):
+    """Render document sections under their headings, sharing max_tokens fairly between them."""
+    ordered_sections = [section for section in SECTION_ORDER if sections.get(section)]
+    headings = [f"{section.capitalize()}:\n" for section in ordered_sections]
+    fitted_sections = fit_sections_to_token_budget(
+        [sections[section] for section in ordered_sections],
+        max_tokens - sum(count_tokens(heading) for heading in headings),
+    )
+    return "\n\n".join(heading + text for heading, text in zip(headings, fitted_sections) if text)
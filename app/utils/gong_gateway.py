@@ -0,0 +1,127 @@
+from contextvars import ContextVar
+from config import constants
+from config.db_connection import db
+from datetime import datetime, timezone
+from logging_module import logger
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from utils.rate_limiting import PriorityRateLimiter, TokenBucket
+import asyncio
+import time
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BACKGROUND = 1
+
+# Set to PRIORITY_BACKGROUND by bulk syncs so that interactive requests go first
+gong_priority = ContextVar("gong_priority", default=PRIORITY_INTERACTIVE)
+
+# A bucket of one second of requests, Gong counts its limit per second
+rate_limiter = PriorityRateLimiter(
+    [TokenBucket(constants.GONG_REQUESTS_PER_SECOND * 60, capacity=constants.GONG_REQUESTS_PER_SECOND)]
+)
+# Monotonic time before which no request is sent, set from the Retry-After of a 429
+paused_until = 0.0
+
+gateway_metrics = {
+    "requests": 0,
+    "retries": 0,
+    "rate_limited_responses": 0,
+    "queued_requests": 0,
+    "queue_wait_seconds": 0.0,
+    "quota_rejections": 0,
+}
+
+
+class GongQuotaExceededError(Exception):
+    """Raised when the daily Gong quota left to the caller's priority is used up."""
+
+
+def get_retry_after_seconds(response):
+    """Read the delay Gong asked for, GONG_DEFAULT_RETRY_AFTER_SECONDS when it did not send one."""
+    try:
+        return float(response.headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return constants.GONG_DEFAULT_RETRY_AFTER_SECONDS
+
+
+def get_quota_day():
+    """Gong resets its daily quota at midnight UTC."""
+    return datetime.now(timezone.utc).date().isoformat()
+
+
+async def increment_daily_quota(amount):
+    """Add amount to today's request count, shared by every worker and kept across restarts, and return it."""
+    quota_collection = db[constants.GONG_DAILY_QUOTA_COLLECTION]
+    update = {"$inc": {"used": amount}}
+    try:
+        quota = await quota_collection.find_one_and_update(
+            {"day": get_quota_day()}, update, upsert=True, return_document=ReturnDocument.AFTER
+        )
+    except DuplicateKeyError:
+        # Another request created today's counter at the same time
+        quota = await quota_collection.find_one_and_update(
+            {"day": get_quota_day()}, update, return_document=ReturnDocument.AFTER
+        )
+    return quota["used"]
+
+
+async def reserve_daily_quota(priority):
+    """Take one request from the daily quota, bulk syncs leave GONG_INTERACTIVE_DAILY_RESERVE of it untouched."""
+    reserved = constants.GONG_INTERACTIVE_DAILY_RESERVE if priority == PRIORITY_BACKGROUND else 0
+    used = await increment_daily_quota(1)
+    if used > constants.GONG_DAILY_REQUEST_QUOTA - reserved:
+        await increment_daily_quota(-1)
+        gateway_metrics["quota_rejections"] += 1
+        raise GongQuotaExceededError(
+            f"The daily Gong quota of {constants.GONG_DAILY_REQUEST_QUOTA} requests is used up"
+        )
+
+
+async def wait_for_capacity(priority):
+    """Queue the request until a 429 pause is over and the per-second bucket can take it."""
+    start_time = time.monotonic()
+    while True:
+        while time.monotonic() < paused_until:
+            await asyncio.sleep(paused_until - time.monotonic())
+        await rate_limiter.acquire([1], priority)
+        # A 429 may have paused the requests while this one was queued
+        if time.monotonic() >= paused_until:
+            break
+    queue_wait = time.monotonic() - start_time
+    if queue_wait > 0.001:
+        gateway_metrics["queued_requests"] += 1
+        gateway_metrics["queue_wait_seconds"] += queue_wait
+
+
+async def send_with_rate_limit(request):
+    """Run request, a coroutine factory returning an HTTP response, within the Gong rate limits.
+
+    A 429 pauses every Gong request for the Retry-After delay, then the request is retried.
+    """
+    global paused_until
+    priority = gong_priority.get()
+    for attempt in range(constants.GONG_MAX_RETRIES + 1):
+        await wait_for_capacity(priority)
+        await reserve_daily_quota(priority)
+        gateway_metrics["requests"] += 1
+        response = await request()
+        if response.status_code != 429 or attempt == constants.GONG_MAX_RETRIES:
+            return response
+        gateway_metrics["rate_limited_responses"] += 1
+        gateway_metrics["retries"] += 1
+        retry_after = get_retry_after_seconds(response)
+        paused_until = max(paused_until, time.monotonic() + retry_after)
+        logger.warning(f"Gong rate limited the request, retrying in {retry_after:.2f}s")
+
+
+async def get_gateway_metrics():
+    quota = await db[constants.GONG_DAILY_QUOTA_COLLECTION].find_one({"day": get_quota_day()})
+    used = quota["used"] if quota else 0
+    return {
+        **gateway_metrics,
+        "queue_wait_seconds": round(gateway_metrics["queue_wait_seconds"], 3),
+        "waiting": len(rate_limiter.waiters),
+        "daily_quota": constants.GONG_DAILY_REQUEST_QUOTA,
+        "daily_quota_used": used,
+        "daily_quota_remaining": max(0, constants.GONG_DAILY_REQUEST_QUOTA - used),
+    }
@@ -1,17 +1,45 @@
 from datetime import datetime
-from openai import OpenAI
 from config import constants
 from logging_module import logger
+from utils.token_utils import count_tokens, fit_sections_to_token_budget, split_to_tokens, truncate_to_tokens
+from utils import document_utils, model_router
 import pdfplumber
 from services.salesforce_service import (
-    get_salesforce_user_first_document,
+    download_salesforce_content_version,
+    get_salesforce_instance,
+    get_salesforce_user_first_document_version,
     get_salesforce_user_notes,
 )
-from io import BytesIO
-
-client = OpenAI(
-    api_key=constants.OPENAI_API_KEY,
+from services import cache_service
+import asyncio
+import hashlib
+import json
+import re
+
+SUMMARIZER_SYSTEM_PROMPT = "You are an expert summarizer. You are going to extract the Strength, Weakness, Overall how is the conversation for job role and summarize the conversation. You are going to be a bit more critical in your analysis. Also you need to look for following points 1. Do the candidates refer to metrics? 2. Are they concise or long winded? 3. Do they minimize filler words? 4. Do they talk like an executive?"
+SUMMARY_REDUCE_SYSTEM_PROMPT = (
+    "You are given summaries of consecutive parts of a single conversation. Merge them into one summary of the whole conversation, removing repetition. "
+    + SUMMARIZER_SYSTEM_PROMPT
+)
+PACKED_SUMMARIZER_SYSTEM_PROMPT = (
+    "You are given several separate conversations, each starting with a line of the form === CALL <id> ===. "
+    "Summarize every conversation on its own and start each summary with the same === CALL <id> === line, "
+    "in the order the conversations are given. "
+    + SUMMARIZER_SYSTEM_PROMPT
 )
+# Delimiter line of every conversation in a packed summarization request and its response
+PACKED_CALL_DELIMITER_PATTERN = re.compile(r"^[\W_]*=== CALL (\S+) ===[\W_]*$", re.MULTILINE)
+# Derived from the prompt text and models so that editing either invalidates cached summaries
+SUMMARIZER_PROMPT_VERSION = hashlib.sha256(
+    (
+        SUMMARIZER_SYSTEM_PROMPT
+        + SUMMARY_REDUCE_SYSTEM_PROMPT
+        + PACKED_SUMMARIZER_SYSTEM_PROMPT
+        + ",".join(model_router.MODEL_ROUTES[model_router.STAGE_SUMMARIZE])
+    ).encode("utf-8")
+).hexdigest()[:12]
+# Tokens taken by the "Resume Text:", "Conversation Transcript:", "Conversation Metrics" and "Notes:" headers
+PROMPT_SECTION_HEADERS_TOKENS = 48
 
 
 def convert_datetime_to_str(obj):
@@ -26,35 +54,32 @@ def convert_object_datetime_keys_to_str(obj):
     return obj
 
 
-def parse_transcript(transcript_json):
-    """Extract and combine transcript text from JSON data."""
-    try:
-        conversation_transcript = ""
-        transcript_sections = transcript_json.get("transcript", [])
-        for section in transcript_sections:
-            speaker_id = section.get("speakerId", "Unknown Speaker")
-            sentences = section.get("sentences", [])
-            for sentence in sentences:
-                conversation_transcript += f"{speaker_id}: {sentence.get('text', '')}\n"
-        return {"transcript": conversation_transcript.strip(), "status_code": 200}
-    except Exception as e:
-        return {
-            "error": f"An error occurred while parsing the transcript: {e}",
-            "status_code": 500,
-        }
+def create_prompt_preamble(job_description):
+    """Create the job description part of the GPT prompt, shared by every candidate screened for the role."""
+    return f"""
+            Here is a Job Description. Resume Text, Summary of the Conversation Transcript and Notes(optional). Based on Rubric and Interpersonal Compatibility Guidelines Provide a clear decision (Suitable, Not Suitable, Requires Further Evaluation). 
+            
+            Job Description:
+            {job_description}
+            """
 
 
 def create_prompt(
-    job_description, conversation_transcript=None, resume_text=None, notes=None
+    job_description,
+    conversation_transcript=None,
+    resume_text=None,
+    notes=None,
+    prompt_preamble=None,
+    conversation_metrics=None,
 ):
     """Create a detailed GPT prompt using the job description, conversation transcript, and resume text."""
 
-    prompt = f"""
-            Here is a Job Description. Resume Text, Summary of the Conversation Transcript and Notes(optional). Based on Rubric and Interpersonal Compatibility Guidelines Provide a clear decision (Suitable, Not Suitable, Requires Further Evaluation). 
-            
-            Job Description:
-            {job_description}
-            """
+    prompt = prompt_preamble or create_prompt_preamble(job_description)
+    prompt = truncate_to_tokens(prompt, constants.MAX_PROMPT_TOKENS)
+    resume_text, conversation_transcript, conversation_metrics, notes = fit_sections_to_token_budget(
+        [resume_text, conversation_transcript, conversation_metrics, notes],
+        constants.MAX_PROMPT_TOKENS - count_tokens(prompt) - PROMPT_SECTION_HEADERS_TOKENS,
+    )
 
     if resume_text:
         prompt += f"\n\nResume Text:\n{resume_text}"
@@ -62,14 +87,18 @@ def create_prompt(
     if conversation_transcript:
         prompt += f"\n\nConversation Transcript:\n{conversation_transcript}"
 
+    if conversation_metrics:
+        prompt += f"\n\nConversation Metrics (measured from the call timings):\n{conversation_metrics}"
+
     if notes:
         prompt += f"\n\nNotes:\n{notes}"
 
     return prompt
 
 
-def get_system_prompt():
-    return f"""
+# Sent unchanged as the first message of every evaluation, so the provider can reuse its cached prefix.
+# Anything that varies per request belongs in the user message built by create_prompt.
+EVALUATION_SYSTEM_PROMPT = """
         You are an expert recruiter specializing in summarizing and analyzing conversations between candidates and hiring managers to find the best fit candidate. You have additional deep expertise in sales enablement which provides guidance on more subtle points of candidate fit.  Your goal is to find best fit candidates based on the criteria detailed below:
 
         1.A level of sales enablement mastery as required for the role using the rubric below.  With that, consider their enablement successes and struggles- programs and initiatives they've run..  Examine closely for sales enablement best practices, highlights of program metrics, and their executive presence.  Also, examine for interpersonal dynamics within prior roles where they may have struggled and overcome obstacles or failed to do so. 
@@ -248,13 +277,28 @@ def get_system_prompt():
 
     """
 
+# Part of the analysis result cache key, so that editing the rubric or its models invalidates cached evaluations
+SYSTEM_PROMPT_VERSION = hashlib.sha256(
+    (EVALUATION_SYSTEM_PROMPT + ",".join(model_router.MODEL_ROUTES[model_router.STAGE_EVALUATE])).encode("utf-8")
+).hexdigest()[:12]
+
 
-def get_gpt_response(prompt, system_prompt):
-    """Send the prompt to GPT API and return the response."""
+def get_system_prompt():
+    return EVALUATION_SYSTEM_PROMPT
+
+
+async def get_gpt_response(prompt, system_prompt, stage=model_router.STAGE_EVALUATE, hedge=False):
+    """Send the prompt to GPT API and return the response.
+
+    With hedge set, a duplicate request is sent when the call is slower than most recent calls of its stage.
+    """
     try:
-        response = client.chat.completions.create(
-            model="gpt-4o",
-            messages=[
+        create_chat_completion = (
+            model_router.create_hedged_chat_completion if hedge else model_router.create_chat_completion
+        )
+        response = await create_chat_completion(
+            stage,
+            [
                 {"role": "system", "content": system_prompt},
                 {"role": "user", "content": prompt},
             ],
@@ -265,9 +309,11 @@ def get_gpt_response(prompt, system_prompt):
         completion_tokens = response.usage.completion_tokens
         return {
             "response": response_data,
+            "model": response.model,
             "finish_reason": finish_reason,
             "prompt_tokens": prompt_tokens,
             "completion_tokens": completion_tokens,
+            "cached_prompt_tokens": model_router.get_cached_prompt_tokens(response.usage),
             "status_code": 200,
         }
     except Exception as e:
@@ -277,11 +323,28 @@ def get_gpt_response(prompt, system_prompt):
         }
 
 
-def test_gpt():
+async def stream_gpt_response(prompt, system_prompt, stage=model_router.STAGE_EVALUATE):
+    """Send the prompt to GPT API and yield the response content as it is generated."""
+    async for content in model_router.stream_chat_completion(
+        stage,
+        [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": prompt},
+        ],
+    ):
+        yield content
+
+
+def format_sse_event(event, data):
+    """Serialize an event in the text/event-stream wire format."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+async def test_gpt():
     """Test the GPT API by sending a sample prompt."""
     prompt = "Hi there! How are you doing today?"
     system_prompt = "You are an expert conversationalist. Please respond to the user's message with a friendly greeting"
-    response = get_gpt_response(prompt, system_prompt)
+    response = await get_gpt_response(prompt, system_prompt, model_router.STAGE_TEST)
     if response["status_code"] == 500:
         return response
     response = f"Response from Mode: {response['response']} Reason for completion: {response['finish_reason']} Prompt tokens: {response['prompt_tokens']} Completion tokens: {response['completion_tokens']}"
@@ -312,19 +375,45 @@ async def parse_pdf_file(resume):
 
 async def get_content_of_pdf_from_salesforce_user(salesforce_user_id):
     try:
-        response = await get_salesforce_user_first_document(salesforce_user_id)
+        # One login for both the version lookup and the download
+        salesforce_instance = await get_salesforce_instance()
+        document_version = await get_salesforce_user_first_document_version(salesforce_user_id, salesforce_instance)
+
+        if document_version.get("status_code") != 200:
+            return document_version
+
+        content_document_id = document_version["content_document_id"]
+        content_version_id = document_version["content_version_id"]
+        resume_version = {
+            "content_document_id": content_document_id,
+            "content_version_id": content_version_id,
+        }
+
+        # A new upload creates a new ContentVersion, so a cached text is never stale
+        resume = await cache_service.get_cached_resume_text(content_document_id, content_version_id)
+        if resume is not None:
+            return {
+                "file_content": resume["text"],
+                "sections": resume["sections"],
+                **resume_version,
+                "cached": True,
+                "status_code": 200,
+            }
+
+        response = await download_salesforce_content_version(
+            document_version["version_data_url"], salesforce_instance
+        )
 
         if response.get("status_code") != 200:
             return response
 
-        file_content_bytes = response["response"]["file_content"]
+        file_content_bytes = response["file_content"]
 
-        file_content = ""
-        with pdfplumber.open(BytesIO(file_content_bytes)) as pdf:
-            for page in pdf.pages:
-                file_content += page.extract_text() or ""
+        # pdfplumber parsing is CPU bound, keep it off the event loop
+        resume = await asyncio.to_thread(document_utils.extract_resume, file_content_bytes)
+        await cache_service.save_resume_text(content_document_id, content_version_id, resume)
 
-        return {"file_content": file_content, "status_code": 200}
+        return {"file_content": resume["text"], "sections": resume["sections"], **resume_version, "status_code": 200}
 
     except Exception as e:
         logger.error(f"Error fetching file content from Salesforce: {e}", exc_info=True)
@@ -349,7 +438,9 @@ async def get_salesforce_user_notes_first_record(salesforce_user_id):
                 "status_code": 404,
             }
 
-        note_body = notes[0].get("Content", "")
+        note_body = truncate_to_tokens(
+            document_utils.normalize_note_text(notes[0].get("Content", "")), constants.NOTES_PROMPT_MAX_TOKENS
+        )
         note_title = notes[0].get("Title", "")
         note_string = f"Note Title: {note_title}\nNote Body: {note_body}"
 
@@ -363,15 +454,12 @@ async def get_salesforce_user_notes_first_record(salesforce_user_id):
         }
 
 
-async def summarize_conversation(conversation_transcript):
+async def summarize_conversation(conversation_transcript, system_prompt=SUMMARIZER_SYSTEM_PROMPT):
     try:
-        response = client.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {
-                    "role": "system",
-                    "content": "You are an expert summarizer. You are going to extract the Strength, Weakness, Overall how is the conversation for job role and summarize the conversation. You are going to be a bit more critical in your analysis. Also you need to look for following points 1. Do the candidates refer to metrics? 2. Are they concise or long winded? 3. Do they minimize filler words? 4. Do they talk like an executive?",
-                },
+        response = await model_router.create_chat_completion(
+            model_router.STAGE_SUMMARIZE,
+            [
+                {"role": "system", "content": system_prompt},
                 {"role": "user", "content": conversation_transcript},
             ],
         )
@@ -379,6 +467,7 @@ async def summarize_conversation(conversation_transcript):
         response_data = response.choices[0].message.content
         return {
             "response": response_data,
+            "model": response.model,
             "finish_reason": finish_reason,
             "status_code": 200,
         }
@@ -387,3 +476,77 @@ async def summarize_conversation(conversation_transcript):
             "response": f"An error occurred while processing the request: {e}",
             "status_code": 500,
         }
+
+
+def group_texts_by_tokens(texts, max_tokens, max_texts=None):
+    """Group consecutive texts so that each group holds at most max_tokens tokens, and at most max_texts texts when given."""
+    groups = []
+    group = []
+    group_tokens = 0
+    for text in texts:
+        text_tokens = count_tokens(text) + 1
+        if group and (group_tokens + text_tokens > max_tokens or len(group) == max_texts):
+            groups.append(group)
+            group = []
+            group_tokens = 0
+        group.append(text)
+        group_tokens += text_tokens
+    if group:
+        groups.append(group)
+    return groups
+
+
+def split_transcript(conversation_transcript, max_tokens):
+    """Split a formatted transcript into chunks of at most max_tokens, cutting between speaker turns."""
+    # A single monologue longer than the budget is spread over several chunks, cut mid turn
+    turns = [piece for turn in conversation_transcript.split("\n") for piece in split_to_tokens(turn, max_tokens - 1)]
+    return ["\n".join(group) for group in group_texts_by_tokens(turns, max_tokens)]
+
+
+async def reduce_conversation_summaries(partial_summaries):
+    """Merge the summaries of consecutive parts of one call into a single summary."""
+    combined_summaries = "\n\n".join(
+        f"Part {index}:\n{partial_summary}" for index, partial_summary in enumerate(partial_summaries, start=1)
+    )
+    combined_summaries = truncate_to_tokens(combined_summaries, constants.TRANSCRIPT_CHUNK_TOKENS)
+    return await summarize_conversation(combined_summaries, SUMMARY_REDUCE_SYSTEM_PROMPT)
+
+
+def format_packed_transcript(call_id, conversation_transcript):
+    """Format one transcript as a delimited section of a packed summarization request."""
+    return f"=== CALL {call_id} ===\n{conversation_transcript}"
+
+
+def split_packed_summaries(packed_summary, call_ids):
+    """Split the response to a packed summarization request into a summary per call id.
+
+    Sections for call ids that were not sent are ignored, calls without a non-empty section are left out.
+    """
+    parts = PACKED_CALL_DELIMITER_PATTERN.split(packed_summary)
+    summaries = {}
+    # re.split alternates the text between delimiters with the captured call ids
+    for call_id, summary in zip(parts[1::2], parts[2::2]):
+        summary = summary.strip()
+        if call_id in call_ids and summary:
+            summaries[call_id] = summary
+    return summaries
+
+
+async def summarize_packed_conversations(conversation_transcripts):
+    """Summarize several short conversations in a single request.
+
+    :param conversation_transcripts: Formatted transcript of each call, by call id.
+    :return: The summary of each call by call id under "response", calls the model skipped are missing.
+    """
+    packed_transcripts = "\n\n".join(
+        format_packed_transcript(call_id, conversation_transcript)
+        for call_id, conversation_transcript in conversation_transcripts.items()
+    )
+    packed_response = await summarize_conversation(packed_transcripts, PACKED_SUMMARIZER_SYSTEM_PROMPT)
+    if packed_response.get("status_code") != 200:
+        return packed_response
+    return {
+        "response": split_packed_summaries(packed_response["response"], conversation_transcripts),
+        "model": packed_response["model"],
+        "status_code": 200,
+    }
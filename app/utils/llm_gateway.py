@@ -0,0 +1,155 @@
+from openai import (
+    AsyncOpenAI,
+    APIConnectionError,
+    InternalServerError,
+    RateLimitError,
+)
+from contextvars import ContextVar
+from config import constants
+from logging_module import logger
+from utils.rate_limiting import PriorityRateLimiter, TokenBucket
+from utils.token_utils import count_tokens
+import asyncio
+import random
+
+# Retries are done here, against our own rate limits, rather than inside the SDK
+client = AsyncOpenAI(
+    api_key=constants.OPENAI_API_KEY,
+    timeout=constants.LLM_REQUEST_TIMEOUT_SECONDS,
+    max_retries=0,
+)
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BACKGROUND = 1
+
+# Set to PRIORITY_BACKGROUND by bulk work (queued jobs, batches) so that interactive requests go first
+llm_priority = ContextVar("llm_priority", default=PRIORITY_INTERACTIVE)
+
+RETRYABLE_ERRORS = (RateLimitError, APIConnectionError, InternalServerError)
+
+# Tokens of chat formatting added around every message
+MESSAGE_OVERHEAD_TOKENS = 4
+
+rate_limiter = PriorityRateLimiter(
+    [
+        TokenBucket(constants.LLM_REQUESTS_PER_MINUTE),
+        TokenBucket(constants.LLM_TOKENS_PER_MINUTE),
+    ]
+)
+
+gateway_metrics = {
+    "requests": 0,
+    "retries": 0,
+    "rate_limited_responses": 0,
+    "queued_requests": 0,
+    "queue_wait_seconds": 0.0,
+}
+
+
+class LLMGatewayQueueTimeoutError(Exception):
+    """Raised when a call waited longer than LLM_GATEWAY_MAX_QUEUE_SECONDS for rate limit capacity."""
+
+
+def estimate_prompt_tokens(messages):
+    """Estimate the prompt tokens of a chat completion, formatting included."""
+    return sum(count_tokens(message["content"]) + MESSAGE_OVERHEAD_TOKENS for message in messages)
+
+
+def estimate_request_tokens(messages, max_tokens=None):
+    """Estimate the tokens a chat completion counts against the TPM limit, prompt plus completion."""
+    return estimate_prompt_tokens(messages) + (max_tokens or constants.LLM_ESTIMATED_COMPLETION_TOKENS)
+
+
+def get_retry_after_seconds(error):
+    """Read the delay the API asked for, None when it did not send one."""
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    retry_after_ms = response.headers.get("retry-after-ms")
+    if retry_after_ms:
+        return float(retry_after_ms) / 1000
+    retry_after = response.headers.get("retry-after")
+    try:
+        return float(retry_after) if retry_after else None
+    except ValueError:
+        return None
+
+
+def get_backoff_seconds(attempt, error):
+    """Honour retry-after when present, otherwise exponential backoff with full jitter."""
+    retry_after = get_retry_after_seconds(error)
+    if retry_after is not None:
+        return retry_after
+    return random.uniform(0, min(constants.LLM_MAX_BACKOFF_SECONDS, constants.LLM_BASE_BACKOFF_SECONDS * 2 ** attempt))
+
+
+async def wait_for_capacity(estimated_tokens):
+    """Queue the call until both the RPM and TPM buckets can take it."""
+    try:
+        queue_wait = await asyncio.wait_for(
+            rate_limiter.acquire([1, estimated_tokens], llm_priority.get()),
+            timeout=constants.LLM_GATEWAY_MAX_QUEUE_SECONDS,
+        )
+    except asyncio.TimeoutError:
+        raise LLMGatewayQueueTimeoutError(
+            f"No LLM capacity within {constants.LLM_GATEWAY_MAX_QUEUE_SECONDS} seconds"
+        )
+    if queue_wait > 0:
+        gateway_metrics["queued_requests"] += 1
+        gateway_metrics["queue_wait_seconds"] += queue_wait
+
+
+def reconcile_usage(estimated_tokens, usage):
+    """Correct the TPM bucket with the real token count once the API reported it."""
+    if usage:
+        rate_limiter.buckets[1].adjust(usage.total_tokens - estimated_tokens)
+
+
+async def send_with_retries(request, estimated_tokens):
+    """Run request, a coroutine factory, within the rate limits, retrying transient failures."""
+    for attempt in range(constants.LLM_MAX_RETRIES + 1):
+        await wait_for_capacity(estimated_tokens)
+        gateway_metrics["requests"] += 1
+        try:
+            return await request()
+        except RETRYABLE_ERRORS as e:
+            if isinstance(e, RateLimitError):
+                gateway_metrics["rate_limited_responses"] += 1
+            if attempt == constants.LLM_MAX_RETRIES:
+                raise
+            backoff_seconds = get_backoff_seconds(attempt, e)
+            logger.warning(f"LLM call failed ({e.__class__.__name__}), retrying in {backoff_seconds:.2f}s")
+            gateway_metrics["retries"] += 1
+            await asyncio.sleep(backoff_seconds)
+
+
+async def create_chat_completion(model, messages, **kwargs):
+    """Create a chat completion through the rate limiter with retries."""
+    estimated_tokens = estimate_request_tokens(messages, kwargs.get("max_tokens"))
+    response = await send_with_retries(
+        lambda: client.chat.completions.create(model=model, messages=messages, **kwargs),
+        estimated_tokens,
+    )
+    reconcile_usage(estimated_tokens, response.usage)
+    return response
+
+
+async def create_chat_completion_stream(model, messages, **kwargs):
+    """Open a streamed chat completion through the rate limiter, retrying until the stream is established.
+
+    Returns the stream with the token estimate to pass to reconcile_usage when the stream reports its usage.
+    """
+    estimated_tokens = estimate_request_tokens(messages, kwargs.get("max_tokens"))
+    stream = await send_with_retries(
+        lambda: client.chat.completions.create(model=model, messages=messages, stream=True, **kwargs),
+        estimated_tokens,
+    )
+    return stream, estimated_tokens
+
+
+def get_gateway_metrics():
+    return {
+        **gateway_metrics,
+        "queue_wait_seconds": round(gateway_metrics["queue_wait_seconds"], 3),
+        "waiting": len(rate_limiter.waiters),
+    }
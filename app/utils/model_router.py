@@ -0,0 +1,256 @@
+from openai import (
+    APIConnectionError,
+    InternalServerError,
+    NotFoundError,
+    RateLimitError,
+)
+from config import constants
+from logging_module import logger
+from utils import llm_gateway
+from collections import deque
+import asyncio
+import math
+import time
+
+STAGE_SUMMARIZE = "summarize"
+STAGE_EVALUATE = "evaluate"
+STAGE_TEST = "test"
+
+# Models tried in order for each pipeline stage, the first one is the preferred tier
+MODEL_ROUTES = {
+    STAGE_SUMMARIZE: constants.MODEL_ROUTE_SUMMARIZE,
+    STAGE_EVALUATE: constants.MODEL_ROUTE_EVALUATE,
+    STAGE_TEST: constants.MODEL_ROUTE_TEST,
+}
+
+# Failures another model may not have once the gateway gave up retrying, anything else (bad request, auth) is raised straight away
+FALLBACK_ERRORS = (RateLimitError, APIConnectionError, InternalServerError, NotFoundError)
+
+model_metrics = {}
+# Latencies of the last successful calls of each stage, the hedging threshold is a percentile of them
+recent_latencies = {}
+# Whether each of the last hedge-eligible requests of a stage was hedged, to cap the hedge rate
+recent_hedges = {}
+hedge_metrics = {}
+
+
+def get_cached_prompt_tokens(usage):
+    """Prompt tokens the provider served from its prompt cache, 0 when it did not report any."""
+    details = getattr(usage, "prompt_tokens_details", None) if usage else None
+    return (getattr(details, "cached_tokens", None) or 0) if details else 0
+
+
+def estimate_latency_saved_seconds(cached_prompt_tokens):
+    """Estimate the prefill time the prompt cache saved for cached_prompt_tokens."""
+    return cached_prompt_tokens / 1000 * constants.PROMPT_CACHE_SECONDS_SAVED_PER_1K_TOKENS
+
+
+def get_prompt_cache_usage(prompt_tokens, cached_prompt_tokens):
+    """Summarize how much of a prompt, or of many, was served from the provider's prompt cache."""
+    return {
+        "prompt_tokens": prompt_tokens,
+        "cached_prompt_tokens": cached_prompt_tokens,
+        "cache_hit_ratio": round(cached_prompt_tokens / prompt_tokens, 3) if prompt_tokens else 0,
+        "estimated_latency_saved_seconds": round(estimate_latency_saved_seconds(cached_prompt_tokens), 3),
+    }
+
+
+def record_model_call(stage, model, latency_seconds, usage=None, error=False):
+    """Accumulate latency and token counts per stage and model tier."""
+    metrics = model_metrics.setdefault(
+        (stage, model),
+        {
+            "calls": 0,
+            "errors": 0,
+            "latency_seconds": 0.0,
+            "prompt_tokens": 0,
+            "cached_prompt_tokens": 0,
+            "completion_tokens": 0,
+            "cache_hit_calls": 0,
+            "cache_hit_latency_seconds": 0.0,
+            "cache_miss_calls": 0,
+            "cache_miss_latency_seconds": 0.0,
+        },
+    )
+    metrics["calls"] += 1
+    metrics["latency_seconds"] += latency_seconds
+    if error:
+        metrics["errors"] += 1
+    if usage:
+        cached_prompt_tokens = get_cached_prompt_tokens(usage)
+        metrics["prompt_tokens"] += usage.prompt_tokens
+        metrics["cached_prompt_tokens"] += cached_prompt_tokens
+        metrics["completion_tokens"] += usage.completion_tokens
+        # Observed latencies of calls with and without a prompt cache hit, to check the estimate against
+        cache_outcome = "cache_hit" if cached_prompt_tokens else "cache_miss"
+        metrics[f"{cache_outcome}_calls"] += 1
+        metrics[f"{cache_outcome}_latency_seconds"] += latency_seconds
+
+
+def get_stage_averages(stage):
+    """Average latency and completion tokens of the successful calls of stage, None while none were recorded."""
+    stage_metrics = [metrics for (metrics_stage, _), metrics in model_metrics.items() if metrics_stage == stage]
+    completed_calls = sum(metrics["cache_hit_calls"] + metrics["cache_miss_calls"] for metrics in stage_metrics)
+    if not completed_calls:
+        return {"average_latency_seconds": None, "average_completion_tokens": None}
+    latency_seconds = sum(
+        metrics["cache_hit_latency_seconds"] + metrics["cache_miss_latency_seconds"] for metrics in stage_metrics
+    )
+    completion_tokens = sum(metrics["completion_tokens"] for metrics in stage_metrics)
+    return {
+        "average_latency_seconds": round(latency_seconds / completed_calls, 3),
+        "average_completion_tokens": round(completion_tokens / completed_calls),
+    }
+
+
+def get_model_metrics():
+    """Summarize the recorded calls of every stage and model tier."""
+    return [
+        {
+            "stage": stage,
+            "model": model,
+            "calls": metrics["calls"],
+            "errors": metrics["errors"],
+            "latency_seconds": round(metrics["latency_seconds"], 3),
+            "average_latency_seconds": round(metrics["latency_seconds"] / metrics["calls"], 3),
+            "completion_tokens": metrics["completion_tokens"],
+            **get_prompt_cache_usage(metrics["prompt_tokens"], metrics["cached_prompt_tokens"]),
+            "cache_hit_calls": metrics["cache_hit_calls"],
+            "average_cache_hit_latency_seconds": round(
+                metrics["cache_hit_latency_seconds"] / metrics["cache_hit_calls"], 3
+            ) if metrics["cache_hit_calls"] else None,
+            "cache_miss_calls": metrics["cache_miss_calls"],
+            "average_cache_miss_latency_seconds": round(
+                metrics["cache_miss_latency_seconds"] / metrics["cache_miss_calls"], 3
+            ) if metrics["cache_miss_calls"] else None,
+        }
+        for (stage, model), metrics in model_metrics.items()
+    ]
+
+
+async def create_chat_completion(stage, messages, **kwargs):
+    """Run a chat completion on the models routed to stage, falling back to the next tier on failure."""
+    models = MODEL_ROUTES[stage]
+    for position, model in enumerate(models):
+        start_time = time.perf_counter()
+        try:
+            response = await llm_gateway.create_chat_completion(model, messages, **kwargs)
+        except FALLBACK_ERRORS as e:
+            record_model_call(stage, model, time.perf_counter() - start_time, error=True)
+            if position == len(models) - 1:
+                raise
+            logger.warning(f"Model {model} failed for stage {stage}, falling back to {models[position + 1]}: {e}")
+            continue
+        latency_seconds = time.perf_counter() - start_time
+        record_model_call(stage, model, latency_seconds, response.usage)
+        recent_latencies.setdefault(stage, deque(maxlen=constants.LLM_HEDGE_LATENCY_WINDOW)).append(latency_seconds)
+        return response
+
+
+def get_hedge_delay_seconds(stage):
+    """Seconds after which a call of stage gets hedged, None until enough latencies were recorded."""
+    latencies = recent_latencies.get(stage)
+    if not latencies or len(latencies) < constants.LLM_HEDGE_MIN_SAMPLES:
+        return None
+    sorted_latencies = sorted(latencies)
+    index = math.ceil(constants.LLM_HEDGE_PERCENTILE / 100 * len(sorted_latencies)) - 1
+    return sorted_latencies[min(max(index, 0), len(sorted_latencies) - 1)]
+
+
+def is_hedge_allowed(stage):
+    """Whether hedging one more request keeps the recent hedge rate of stage within LLM_HEDGE_MAX_RATE."""
+    hedges = recent_hedges.get(stage)
+    if not hedges:
+        return constants.LLM_HEDGE_MAX_RATE > 0
+    return (sum(hedges) + 1) / (len(hedges) + 1) <= constants.LLM_HEDGE_MAX_RATE
+
+
+def record_hedge_outcome(stage, hedged, hedge_won=False, rate_capped=False):
+    metrics = hedge_metrics.setdefault(
+        stage, {"requests": 0, "hedged_requests": 0, "hedge_wins": 0, "rate_capped_requests": 0}
+    )
+    metrics["requests"] += 1
+    metrics["hedged_requests"] += int(hedged)
+    metrics["hedge_wins"] += int(hedge_won)
+    metrics["rate_capped_requests"] += int(rate_capped)
+    recent_hedges.setdefault(stage, deque(maxlen=constants.LLM_HEDGE_LATENCY_WINDOW)).append(hedged)
+
+
+def get_hedge_metrics():
+    """Summarize how many requests of every stage were hedged and how many hedges finished first."""
+    return [
+        {
+            "stage": stage,
+            **metrics,
+            "hedge_rate": round(metrics["hedged_requests"] / metrics["requests"], 3),
+            "hedge_delay_seconds": round(get_hedge_delay_seconds(stage) or 0, 3),
+        }
+        for stage, metrics in hedge_metrics.items()
+    ]
+
+
+async def create_hedged_chat_completion(stage, messages, **kwargs):
+    """Run create_chat_completion, sending a duplicate when the call outlasts the hedging percentile.
+
+    The first successful response wins and the other request is cancelled. A failure of one
+    request is ignored while the other one may still succeed.
+    """
+    hedge_delay_seconds = get_hedge_delay_seconds(stage)
+    primary = asyncio.create_task(create_chat_completion(stage, messages, **kwargs))
+    requests = [primary]
+    try:
+        if hedge_delay_seconds is None:
+            record_hedge_outcome(stage, hedged=False)
+            return await primary
+        done, _ = await asyncio.wait(requests, timeout=hedge_delay_seconds)
+        if done:
+            record_hedge_outcome(stage, hedged=False)
+            return primary.result()
+        if not is_hedge_allowed(stage):
+            record_hedge_outcome(stage, hedged=False, rate_capped=True)
+            return await primary
+        logger.info(f"Call for stage {stage} exceeded {hedge_delay_seconds:.2f}s, sending a hedged request")
+        hedge = asyncio.create_task(create_chat_completion(stage, messages, **kwargs))
+        requests.append(hedge)
+        pending = set(requests)
+        while True:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            winner = next((request for request in done if request.exception() is None), None)
+            if winner is not None or not pending:
+                break
+        record_hedge_outcome(stage, hedged=True, hedge_won=winner is hedge)
+        # Both requests failed, raise the error of the original one
+        return (winner or primary).result()
+    finally:
+        for request in requests:
+            request.cancel()
+
+
+async def stream_chat_completion(stage, messages, **kwargs):
+    """Stream a chat completion on the models routed to stage, yielding content deltas.
+
+    Falling back is only possible until the first chunk has been received.
+    """
+    models = MODEL_ROUTES[stage]
+    for position, model in enumerate(models):
+        start_time = time.perf_counter()
+        try:
+            stream, estimated_tokens = await llm_gateway.create_chat_completion_stream(
+                model, messages, stream_options={"include_usage": True}, **kwargs
+            )
+        except FALLBACK_ERRORS as e:
+            record_model_call(stage, model, time.perf_counter() - start_time, error=True)
+            if position == len(models) - 1:
+                raise
+            logger.warning(f"Model {model} failed for stage {stage}, falling back to {models[position + 1]}: {e}")
+            continue
+        usage = None
+        async for chunk in stream:
+            # With include_usage the last chunk has no choices and carries the token counts
+            if chunk.usage:
+                usage = chunk.usage
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+        record_model_call(stage, model, time.perf_counter() - start_time, usage)
+        llm_gateway.reconcile_usage(estimated_tokens, usage)
+        return
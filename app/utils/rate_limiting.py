@@ -0,0 +1,87 @@
+import asyncio
+import heapq
+import itertools
+import time
+
+
+class TokenBucket:
+    """Token bucket refilled continuously at rate_per_minute, holding at most capacity tokens, one minute by default."""
+
+    def __init__(self, rate_per_minute, capacity=None):
+        self.capacity = capacity or rate_per_minute
+        self.rate_per_second = rate_per_minute / 60
+        self.tokens = rate_per_minute
+        self.updated_at = time.monotonic()
+
+    def refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate_per_second)
+        self.updated_at = now
+
+    def wait_time(self, amount):
+        """Seconds until amount tokens are available, 0 when they already are."""
+        self.refill()
+        # A request larger than the bucket could never be served, let it through on a full bucket
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0
+        return (amount - self.tokens) / self.rate_per_second
+
+    def consume(self, amount):
+        self.refill()
+        self.tokens -= min(amount, self.capacity)
+
+    def adjust(self, amount):
+        """Return (negative amount) or take (positive amount) tokens once the real cost is known."""
+        self.refill()
+        self.tokens = min(self.capacity, self.tokens - amount)
+
+
+class PriorityRateLimiter:
+    """Admit callers through a set of token buckets, lower priority values first and FIFO within a priority."""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.waiters = []
+        self.sequence = itertools.count()
+
+    def wake_head(self):
+        if self.waiters:
+            self.waiters[0][2].set()
+
+    async def acquire(self, costs, priority):
+        """Wait until this caller is first in line and every bucket holds its cost, then consume it.
+
+        :param costs: Amount to take from each bucket, in the order of self.buckets.
+        :param priority: Lower values are served first.
+        :return: Seconds spent waiting, 0 when admitted straight away.
+        """
+        start_time = time.monotonic()
+        waited = False
+        waiter = (priority, next(self.sequence), asyncio.Event())
+        heapq.heappush(self.waiters, waiter)
+        try:
+            while True:
+                if self.waiters[0] is not waiter:
+                    waited = True
+                    waiter[2].clear()
+                    await waiter[2].wait()
+                    continue
+                wait_time = max(bucket.wait_time(cost) for bucket, cost in zip(self.buckets, costs))
+                if wait_time == 0:
+                    for bucket, cost in zip(self.buckets, costs):
+                        bucket.consume(cost)
+                    return time.monotonic() - start_time if waited else 0
+                waited = True
+                # Sleep until the buckets refill, or until a higher priority caller takes the head
+                waiter[2].clear()
+                try:
+                    await asyncio.wait_for(waiter[2].wait(), timeout=wait_time)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            was_head = self.waiters[0] is waiter
+            self.waiters.remove(waiter)
+            heapq.heapify(self.waiters)
+            if was_head:
+                self.wake_head()
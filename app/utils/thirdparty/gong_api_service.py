@@ -1,11 +1,15 @@
-import requests
+import httpx
 import base64
 from config import constants
+from logging_module import logger
+from utils import gong_gateway
 from typing import Optional
-import json
 
+# Shared by every Gong request, keeps connections alive across requests; opened and closed with the app
+client: Optional[httpx.AsyncClient] = None
 
-async def get_api_token():
+
+def get_api_token():
     username = constants.GONG_USERNAME
     password = constants.GONG_PASSWORD
     auth_string = f"{username}:{password}"
@@ -14,80 +18,144 @@ async def get_api_token():
     return f"Basic {auth_base64}"
 
 
+def start_gong_client():
+    """Open the pooled Gong client, with the auth header built once for all requests."""
+    global client
+    if client is None or client.is_closed:
+        client = httpx.AsyncClient(
+            base_url=constants.GONG_BASE_URL or "",
+            headers={"Authorization": get_api_token(), "Content-Type": "application/json"},
+            timeout=httpx.Timeout(
+                constants.UPSTREAM_READ_TIMEOUT_SECONDS, connect=constants.UPSTREAM_CONNECT_TIMEOUT_SECONDS
+            ),
+            limits=httpx.Limits(
+                max_connections=constants.GONG_MAX_CONNECTIONS,
+                max_keepalive_connections=constants.GONG_MAX_KEEPALIVE_CONNECTIONS,
+            ),
+        )
+    return client
+
+
+async def close_gong_client():
+    global client
+    if client is not None:
+        await client.aclose()
+        client = None
+
+
+def get_error_response(response):
+    """Error response of a failed Gong request, a 429 still rate limited once the scheduler retries are used up."""
+    if response.status_code == 429:
+        return {
+            "error": "Gong rate limit exceeded.",
+            "retry_after_seconds": gong_gateway.get_retry_after_seconds(response),
+            "status_code": 429,
+        }
+    logger.error(f"Gong request failed: {response.status_code} - {response.text}")
+    return {"error": response.text, "status_code": 500, "status": response.status_code}
+
+
+def get_gong_client():
+    """The shared Gong client, opened on first use outside the app lifespan (scripts)."""
+    return start_gong_client()
+
+
 async def get_users():
     try:
-        endpoint = f"{constants.GONG_BASE_URL}/v2/users"
-        api_token = await get_api_token()
-        headers = {"Authorization": api_token, "Content-Type": "application/json"}
-        response = requests.get(endpoint, headers=headers)
+        response = await gong_gateway.send_with_rate_limit(
+            lambda: get_gong_client().get("/v2/users")
+        )
         if response.status_code == 200:
-            return response.json()
+            return {"response": response.json(), "status_code": 200}
         else:
-            print(f"Error: {response.status_code} - {response.text}")
-            return None
+            return get_error_response(response)
+    except gong_gateway.GongQuotaExceededError as e:
+        return {"error": str(e), "status_code": 429}
     except Exception as e:
-        print(f"Error: {e}")
-        return None
+        logger.error(f"Gong request failed: {e}")
+        return {"error": str(e), "status_code": 500}
 
 
 async def get_calls_by_date_range(start_date: str, end_date: Optional[str] = None):
     try:
-        endpoint = f"{constants.GONG_BASE_URL}/v2/calls?fromDateTime={start_date}"
+        endpoint = f"/v2/calls?fromDateTime={start_date}"
         if end_date:
             endpoint += f"&toDateTime={end_date}"
-        api_token = await get_api_token()
-        headers = {"Authorization": api_token, "Content-Type": "application/json"}
-        response = requests.get(endpoint, headers=headers)
+        response = await gong_gateway.send_with_rate_limit(
+            lambda: get_gong_client().get(endpoint)
+        )
         if response.status_code == 200:
-            return response.json()
+            return {"response": response.json(), "status_code": 200}
         else:
-            print(f"Error: {response.status_code} - {response.text}")
-            return None
+            return get_error_response(response)
+    except gong_gateway.GongQuotaExceededError as e:
+        return {"error": str(e), "status_code": 429}
     except Exception as e:
-        print(f"Error: {e}")
-        return None
+        logger.error(f"Gong request failed: {e}")
+        return {"error": str(e), "status_code": 500}
 
 
 async def get_call_transcript_by_call_id(call_id):
     try:
-        endpoint = f"{constants.GONG_BASE_URL}/v2/calls/transcript"
-        api_token = await get_api_token()
-        headers = {"Authorization": api_token, "Content-Type": "application/json"}
-        payload = json.dumps({"filter": {"callIds": call_id}})
-        response = requests.post( endpoint, headers=headers, data=payload)
+        payload = {"filter": {"callIds": call_id}}
+        response = await gong_gateway.send_with_rate_limit(
+            lambda: get_gong_client().post("/v2/calls/transcript", json=payload)
+        )
         if response.status_code == 200:
             return {"response": response.json(), "status_code": 200}
         else:
-            print(f"Error: {response.status_code} - {response.text}")
-            return {"error": response.text, "status_code": 500, "status": response.status_code}
+            return get_error_response(response)
+    except gong_gateway.GongQuotaExceededError as e:
+        return {"error": str(e), "status_code": 429}
     except Exception as e:
-        print(f"Error: {e}")
+        logger.error(f"Gong request failed: {e}")
         return {"error": str(e), "status_code": 500}
 
 
-async def get_gong_extensive_call_data(cursor: Optional[str] = None):
+async def get_call_parties_by_call_id(call_id):
     try:
-        endpoint = f"{constants.GONG_BASE_URL}/v2/calls/extensive"
-        api_token = await get_api_token()
-        headers = {"Authorization": api_token, "Content-Type": "application/json"}
+        payload = {
+            "contentSelector": {"exposedFields": {"parties": True}},
+            "filter": {"callIds": call_id},
+        }
+        response = await gong_gateway.send_with_rate_limit(
+            lambda: get_gong_client().post("/v2/calls/extensive", json=payload)
+        )
+        if response.status_code == 200:
+            return {"response": response.json(), "status_code": 200}
+        else:
+            return get_error_response(response)
+    except gong_gateway.GongQuotaExceededError as e:
+        return {"error": str(e), "status_code": 429}
+    except Exception as e:
+        logger.error(f"Gong request failed: {e}")
+        return {"error": str(e), "status_code": 500}
+
 
+async def get_gong_extensive_call_data(
+    cursor: Optional[str] = None, from_date_time: Optional[str] = None, to_date_time: Optional[str] = None
+):
+    try:
         payload = {
             "contentSelector": {"exposedFields": {"parties": True}},
             "filter": {},
         }
+        if from_date_time:
+            payload["filter"]["fromDateTime"] = from_date_time
+        if to_date_time:
+            payload["filter"]["toDateTime"] = to_date_time
         if cursor:
             payload["cursor"] = cursor
 
-        response = requests.post(endpoint, headers=headers, data=json.dumps(payload))
+        response = await gong_gateway.send_with_rate_limit(
+            lambda: get_gong_client().post("/v2/calls/extensive", json=payload)
+        )
         if response.status_code == 200:
             return {"response": response.json(), "status_code": 200}
         else:
-            print(f"Error: {response.status_code} - {response.text}")
-            return {
-                "error": response.text,
-                "status_code": 500,
-                "status": response.status_code,
-            }
+            return get_error_response(response)
+    except gong_gateway.GongQuotaExceededError as e:
+        return {"error": str(e), "status_code": 429}
     except Exception as e:
-        print(f"Error: {e}")
+        logger.error(f"Gong request failed: {e}")
         return {"error": str(e), "status_code": 500}
@@ -5,13 +5,28 @@ import requests
 import base64
 
 
+class TimeoutSession(requests.Session):
+    """requests session applying a default timeout, requests itself waits forever."""
+
+    def __init__(self, timeout):
+        super().__init__()
+        self.timeout = timeout
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        return super().request(method, url, **kwargs)
+
+
 class SalesforceApiService:
     def __init__(self):
+        # Login, queries and downloads all go through this session and its timeout
+        self.session = TimeoutSession(constants.UPSTREAM_REQUEST_TIMEOUT)
         self.sf = Salesforce(
             username=constants.SALESFORCE_USERNAME,
             password=constants.SALESFORCE_PASSWORD,
             security_token=constants.SALESFORCE_SECURITY_TOKEN,
             domain=constants.SALESFORCE_DOMAIN,
+            session=self.session,
         )
 
     def get_salesforce_data(self, query):
@@ -113,7 +128,7 @@ class SalesforceApiService:
             full_url = f"https://{base_url}{version_data_url}"
 
             headers = {"Authorization": f"Bearer {self.sf.session_id}"}
-            response = requests.get(full_url, headers=headers)
+            response = self.session.get(full_url, headers=headers)
             if response.status_code == 200:
                 return {"file_content": response.content, "status_code": 200}
             else:
@@ -125,12 +140,22 @@ class SalesforceApiService:
             logger.error(f"Error downloading file from Salesforce: {e}")
             return None
 
-    def get_salesforce_user_first_document(self, user_id):
+    def get_latest_content_version(self, content_document_id):
         """
-        Get the first document linked to a specific user in Salesforce.
+        Get the latest ContentVersion of a document in Salesforce.
+
+        :param content_document_id: ContentDocumentId of the file.
+        :return: ContentVersion record with its Id and VersionData URL.
+        """
+        query = f"SELECT Id, VersionData FROM ContentVersion WHERE ContentDocumentId = '{content_document_id}' AND IsLatest = true"
+        return self.sf.query(query)["records"][0]
+
+    def get_salesforce_user_first_document_version(self, user_id):
+        """
+        Get the latest version of the first document linked to a specific user in Salesforce, without downloading it.
 
         :param user_id: Salesforce user ID.
-        :return: ContentDocumentId of the first document linked to the user.
+        :return: ContentDocumentId, ContentVersion Id and VersionData URL of the first document linked to the user.
         """
         try:
             query = f"SELECT ContentDocumentId FROM ContentDocumentLink WHERE LinkedEntityId = '{user_id}'"
@@ -139,22 +164,55 @@ class SalesforceApiService:
             if not content_document_links:
                 return {"message": "No documents linked to the user", "status_code": 404}
             content_document_id = content_document_links[0]["ContentDocumentId"]
+            content_version = self.get_latest_content_version(content_document_id)
 
-            query = f"SELECT VersionData FROM ContentVersion WHERE ContentDocumentId = '{content_document_id}'"
-            version_data_url = self.sf.query(query)["records"][0]["VersionData"]
+            return {
+                "content_document_id": content_document_id,
+                "content_version_id": content_version["Id"],
+                "version_data_url": content_version["VersionData"],
+                "status_code": 200,
+            }
+        except Exception as e:
+            logger.error(f"Error fetching linked files from Salesforce: {e}")
+            return {"message": f"An error occurred while fetching linked files from Salesforce: {e}", "status_code": 500}
 
-            base_url = self.sf.sf_instance
-            full_url = f"https://{base_url}{version_data_url}"
+    def download_version_data(self, version_data_url):
+        """
+        Download the binary content of a ContentVersion.
 
-            headers = {"Authorization": f"Bearer {self.sf.session_id}"}
-            response = requests.get(full_url, headers=headers)
-            if response.status_code == 200:
-                return {"file_content": response.content, "status_code": 200}
-            else:
-                return {
-                    "message": "Error downloading file from Salesforce",
-                    "status_code": 500,
-                }
+        :param version_data_url: VersionData URL of the ContentVersion.
+        :return: File content.
+        """
+        base_url = self.sf.sf_instance
+        full_url = f"https://{base_url}{version_data_url}"
+
+        headers = {"Authorization": f"Bearer {self.sf.session_id}"}
+        response = self.session.get(full_url, headers=headers)
+        if response.status_code == 200:
+            return {"file_content": response.content, "status_code": 200}
+        else:
+            return {
+                "message": "Error downloading file from Salesforce",
+                "status_code": 500,
+            }
+
+    def get_salesforce_user_first_document(self, user_id):
+        """
+        Get the first document linked to a specific user in Salesforce.
+
+        :param user_id: Salesforce user ID.
+        :return: ContentDocumentId of the first document linked to the user.
+        """
+        try:
+            document_version = self.get_salesforce_user_first_document_version(user_id)
+            if document_version["status_code"] != 200:
+                return document_version
+
+            response = self.download_version_data(document_version["version_data_url"])
+            if response["status_code"] == 200:
+                response["content_document_id"] = document_version["content_document_id"]
+                response["content_version_id"] = document_version["content_version_id"]
+            return response
         except Exception as e:
             logger.error(f"Error fetching linked files from Salesforce: {e}")
             return {"message": f"An error occurred while fetching linked files from Salesforce: {e}", "status_code": 500}
@@ -202,7 +260,7 @@ class SalesforceApiService:
         try:
             note_content_url = f"{self.sf.base_url}/sobjects/ContentNote/{content_id}/Content"
             headers = {"Authorization": f"Bearer {self.sf.session_id}"}
-            response = requests.get(note_content_url, headers=headers)
+            response = self.session.get(note_content_url, headers=headers)
             
             if response.status_code == 200:
                 note_content = response.text
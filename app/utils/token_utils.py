@@ -0,0 +1,73 @@
+from functools import lru_cache
+from logging_module import logger
+import tiktoken
+
+# Rough ratio for English text, used when the tokenizer cannot be loaded
+CHARACTERS_PER_TOKEN = 4
+
+
+@lru_cache(maxsize=1)
+def get_encoding():
+    """Load the tokenizer of the gpt-4o model family, None when it is unavailable."""
+    try:
+        return tiktoken.get_encoding("o200k_base")
+    except Exception as e:
+        # tiktoken downloads its vocabulary on first use, fall back to an estimate when offline
+        logger.error(f"Error loading tiktoken encoding, estimating token counts instead: {e}")
+        return None
+
+
+def count_tokens(text):
+    """Count the tokens of text for the gpt-4o model family."""
+    if not text:
+        return 0
+    encoding = get_encoding()
+    if encoding is None:
+        return (len(text) + CHARACTERS_PER_TOKEN - 1) // CHARACTERS_PER_TOKEN
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def truncate_to_tokens(text, max_tokens):
+    """Cut text down to at most max_tokens tokens."""
+    if count_tokens(text) <= max_tokens:
+        return text
+    if max_tokens <= 0:
+        return ""
+    encoding = get_encoding()
+    if encoding is None:
+        return text[: max_tokens * CHARACTERS_PER_TOKEN]
+    return encoding.decode(encoding.encode(text, disallowed_special=())[:max_tokens])
+
+
+def split_to_tokens(text, max_tokens):
+    """Split text into consecutive pieces of at most max_tokens tokens."""
+    if count_tokens(text) <= max_tokens or max_tokens <= 0:
+        return [text]
+    encoding = get_encoding()
+    if encoding is None:
+        piece_characters = max_tokens * CHARACTERS_PER_TOKEN
+        return [text[start : start + piece_characters] for start in range(0, len(text), piece_characters)]
+    tokens = encoding.encode(text, disallowed_special=())
+    return [encoding.decode(tokens[start : start + max_tokens]) for start in range(0, len(tokens), max_tokens)]
+
+
+def fit_sections_to_token_budget(sections, max_tokens):
+    """Truncate text sections so that together they fit in max_tokens.
+
+    The budget is shared fairly: sections smaller than their share are kept whole and
+    what they leave unused goes to the larger ones.
+    """
+    section_tokens = [count_tokens(section) for section in sections]
+    if sum(section_tokens) <= max_tokens:
+        return sections
+
+    fitted_sections = list(sections)
+    remaining_tokens = max(max_tokens, 0)
+    order = sorted(range(len(sections)), key=lambda index: section_tokens[index])
+    for position, index in enumerate(order):
+        share = remaining_tokens // (len(order) - position)
+        if section_tokens[index] > share:
+            logger.warning(f"Truncating prompt section from {section_tokens[index]} to {share} tokens")
+            fitted_sections[index] = truncate_to_tokens(sections[index], share)
+        remaining_tokens -= min(section_tokens[index], share)
+    return fitted_sections
@@ -0,0 +1,141 @@
+from collections import deque
+from config import constants
+from utils.token_utils import count_tokens
+import re
+
+UNKNOWN_SPEAKER_ID = "Unknown Speaker"
+# Hesitations that carry no content wherever they appear
+FILLER_PATTERN = re.compile(r"(?:,\s*)?\b(?:u+[hm]+|e+r+m+|a+h+|h+m+|m+h*m+)\b[,.]?", re.IGNORECASE)
+# A word repeated right after itself, "I, I think" or "the the"
+STUTTER_PATTERN = re.compile(r"\b([^\W\d_]+)(?:,?\s+\1\b)+", re.IGNORECASE)
+BACKCHANNEL_PATTERN = re.compile(
+    r"\b(?:yeah|yes|yep|yup|right|okay|ok|sure|exactly|totally|absolutely|definitely|cool|great|nice|perfect|"
+    r"gotcha|got it|i see|makes sense|true|correct|wow|oh|mm-?hmm|uh-?huh|u+[hm]+|h+m+|m+h*m+)\b"
+)
+WORD_PATTERN = re.compile(r"\w+")
+
+
+def get_speaker_label(party):
+    """Label a Gong call party by name, with their title or affiliation as role when known."""
+    name = party.get("name") or party.get("emailAddress") or "Unknown"
+    role = party.get("title") or party.get("affiliation")
+    return f"{name} ({role})" if role else name
+
+
+def get_speaker_labels(parties):
+    """Map the speakerId of every party of a Gong call to its speaker label."""
+    return {party["speakerId"]: get_speaker_label(party) for party in parties or [] if party.get("speakerId")}
+
+
+def complete_speaker_labels(transcript_json, speaker_labels=None):
+    """Add a "Speaker 1", "Speaker 2"... label, in order of appearance, for every speaker missing from speaker_labels."""
+    speaker_labels = dict(speaker_labels or {})
+    unlabelled_speakers = 0
+    for section in transcript_json.get("transcript", []):
+        speaker_id = section.get("speakerId", UNKNOWN_SPEAKER_ID)
+        if speaker_id not in speaker_labels:
+            unlabelled_speakers += 1
+            speaker_labels[speaker_id] = f"Speaker {unlabelled_speakers}"
+    return speaker_labels
+
+
+def iter_sentences(transcript_json):
+    """Yield (speaker_id, text) for every sentence of a Gong transcript, in order."""
+    for section in transcript_json.get("transcript", []):
+        speaker_id = section.get("speakerId", UNKNOWN_SPEAKER_ID)
+        for sentence in section.get("sentences", []):
+            yield speaker_id, sentence.get("text", "")
+
+
+def is_backchannel(text):
+    """Whether a sentence only acknowledges the other speaker, like "Yeah, okay." or "Mm-hmm."."""
+    return not BACKCHANNEL_PATTERN.sub("", text.lower()).strip(" ,.!?;:-")
+
+
+def clean_sentence(text):
+    """Remove filler words and stuttered repeats from a sentence."""
+    text = FILLER_PATTERN.sub("", text)
+    text = STUTTER_PATTERN.sub(r"\1", text)
+    return " ".join(text.split()).lstrip(" ,;:-")
+
+
+def compact_sentences(sentences, dedup_window, dedup_min_words=constants.TRANSCRIPT_DEDUP_MIN_WORDS):
+    """Drop the filler, backchannels and repeats of a stream of (speaker_id, text) sentences.
+
+    A sentence opening a turn right after a question is the answer and is always kept. Otherwise
+    a sentence of at least dedup_min_words words is a repeat when the same words were said within
+    the last dedup_window kept sentences, shorter ones like "No." are never repeats.
+    """
+    recent_sentences = deque(maxlen=dedup_window)
+    previous_speaker_id = None
+    previous_text = ""
+    for speaker_id, text in sentences:
+        answers_question = speaker_id != previous_speaker_id and previous_text.rstrip().endswith("?")
+        if is_backchannel(text):
+            if not answers_question:
+                continue
+        else:
+            text = clean_sentence(text)
+            words = WORD_PATTERN.findall(text.lower())
+            if not words:
+                continue
+            if len(words) >= dedup_min_words:
+                normalized_text = " ".join(words)
+                if normalized_text in recent_sentences and not answers_question:
+                    continue
+                recent_sentences.append(normalized_text)
+        previous_speaker_id = speaker_id
+        previous_text = text
+        yield speaker_id, text
+
+
+def iter_speaker_turns(sentences):
+    """Yield (speaker_id, sentence texts) for every run of consecutive sentences of one speaker.
+
+    Gong splits a transcript into sections per speaker and topic, a new topic does not start a new turn.
+    """
+    turn_speaker_id = None
+    turn_sentences = []
+    for speaker_id, text in sentences:
+        if speaker_id != turn_speaker_id and turn_sentences:
+            yield turn_speaker_id, turn_sentences
+            turn_sentences = []
+        turn_speaker_id = speaker_id
+        turn_sentences.append(text)
+    if turn_sentences:
+        yield turn_speaker_id, turn_sentences
+
+
+def parse_transcript(transcript_json, speaker_labels=None, compact=False):
+    """Extract and combine transcript text from JSON data, one line per speaker turn.
+
+    :param transcript_json: A Gong call transcript, with its sections of sentences.
+    :param speaker_labels: Label of each speakerId, see get_speaker_labels. Speakers missing from it
+        are labelled by complete_speaker_labels.
+    :param compact: Remove filler, backchannels and repeated sentences, see compact_sentences.
+    """
+    try:
+        speaker_labels = complete_speaker_labels(transcript_json, speaker_labels)
+        lines = []
+        sentences = iter_sentences(transcript_json)
+        if compact:
+            sentences = compact_sentences(sentences, constants.TRANSCRIPT_DEDUP_WINDOW_SENTENCES)
+        for speaker_id, turn_sentences in iter_speaker_turns(sentences):
+            lines.append(f"{speaker_labels[speaker_id]}: {' '.join(turn_sentences)}")
+        return {"transcript": "\n".join(lines).strip(), "status_code": 200}
+    except Exception as e:
+        return {
+            "error": f"An error occurred while parsing the transcript: {e}",
+            "status_code": 500,
+        }
+
+
+def get_compaction_report(original_transcript, compacted_transcript):
+    """Count the tokens compaction removed from a formatted transcript."""
+    original_tokens = count_tokens(original_transcript)
+    compacted_tokens = count_tokens(compacted_transcript)
+    return {
+        "original_tokens": original_tokens,
+        "compacted_tokens": compacted_tokens,
+        "tokens_saved": original_tokens - compacted_tokens,
+    }